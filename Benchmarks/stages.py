@@ -0,0 +1,163 @@
+'''Microbenchmarks of every stage of the pipelines on the fixtures in Tests/, reports the median and p95 time and the peak
+memory of each stage
+
+    python Benchmarks/stages.py --repeat 50
+    python Benchmarks/stages.py --repeat 50 --json stages.json
+    python Benchmarks/stages.py --compare stages.json --tolerance 0.25
+    python Benchmarks/stages.py --stage "regression*"
+
+Every stage runs once as a warm up, then repeat times for the timings and once more under tracemalloc for the peak memory
+so the tracing never slows down the timed runs. Whatever a stage needs from the previous stages is prepared outside of the
+timed call. With --compare the medians are checked against a previous --json report and the exit code is 1 if any stage got
+slower than the tolerance allows.
+'''
+import argparse
+import fnmatch
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+
+import numpy as np
+from Classes.ExcelWrapper import ExcelWrapper
+from Classes.Plate import Plate
+from Classes.PlateCache import PlateCache, load_export
+from Classes.Sample import Sample
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.StandardCurve import fit_curves
+from PrismAutomators.prism_templates import PrismTemplate, TEMPLATE_STRUCTURES
+from PrismAutomators.prism_writer import Binding
+import ExcelAutomators.elisa_main as em
+import ExcelAutomators.elisa_standards as es
+from settings import *
+
+ELISA_FIXTURE = "Tests/test.txt"
+CLINICAL_FIXTURE = "Tests/20231128 Preliminary Data for Clinical Validation EAS.txt"
+WORKBOOK_FIXTURE = "Tests/test.xlsx"
+# Number of plates fitted at once by the batched regression stages
+BATCH_PLATES = 500
+
+def elisa_groups()->dict[str, list[Sample]]:
+    '''The samples and controls of the ELISA fixture, the same as the GUI defaults'''
+    controls = [Sample(f"MIR{number:03d}") for number in range(1, 14)] + [Sample("PosControl"), Sample("NegControl"), Sample("Blank")]
+    return {"samples":[Sample(number) for number in range(1, 33)], "controls":controls}
+
+def standards_samples()->tuple[list[Sample], list[Sample]]:
+    '''The samples and standards of a duplicates standards run of the ELISA fixture'''
+    labels, concentrations, _ = es.determine_standards("1", "ug/mL", "2", "6")
+    standards = [Sample(label=label, ab_concentration=concentration) for label, concentration in zip(labels, concentrations)]
+    return [Sample(number) for number in range(1, 21)], standards + [Sample("IgG Depleted Serum"), Sample("IgG1, Kappa Isotype AB", ab_concentration=0)]
+
+def stages(output_dir:str)->dict[str, tuple[Callable[..., Any], Callable[[], tuple]]]:
+    '''Returns the stages by name as (function, setup), setup is called before every run and returns the arguments of function'''
+    export = SoftMaxExport(ELISA_FIXTURE)
+    readings = export.readings()
+    samples, standards = standards_samples()
+    es.extract_duplicates(Plate(readings), samples, standards)
+    standard_conc = [standard.ab_concentration for standard in standards[:-2]]
+    standard_ods = [standard.average for standard in standards[:-2]]
+    rng = np.random.default_rng(0)
+    batch_conc = np.tile(standard_conc, (BATCH_PLATES, 1))
+    batch_ods = np.asarray(standard_ods)*rng.normal(1, 0.05, batch_conc.shape)
+    _, data = em.analyze_data(ELISA_FIXTURE, output_dir, elisa_groups()["samples"], elisa_groups()["controls"][:-3], export=export)
+    template = PrismTemplate(ELISA_TEMPLATE, TEMPLATE_STRUCTURES[ELISA_TEMPLATE])
+    bindings = [Binding(table, 0, data["sample_labels"]) for table in range(2)] + [
+        Binding(0, 1, data["control_averages"]), Binding(0, 2, data["sample_averages"]),
+        Binding(1, 1, data["control_normalized"]), Binding(1, 2, data["sample_normalized"]),
+    ]
+
+    def filled_wrapper()->tuple:
+        ewrapper = ExcelWrapper(ELISA_FIXTURE, export)
+        for column, values in zip(["P", "S", "AB"], [data["sample_labels"], data["sample_averages"], data["sample_normalized"]]):
+            ewrapper.add_column(column, values)
+        return ewrapper, os.path.join(output_dir, "stage.xlsx")
+
+    return {
+        "parse[elisa]":(SoftMaxExport, lambda: (ELISA_FIXTURE,)),
+        "parse[clinical]":(SoftMaxExport, lambda: (CLINICAL_FIXTURE,)),
+        "parse[plate cache, memory]":(load_export, lambda: (ELISA_FIXTURE,)),
+        "parse[plate cache, disk]":(lambda cache: cache.load(ELISA_FIXTURE), lambda: (PlateCache(),)),
+        "excel_wrapper[txt]":(ExcelWrapper, lambda: (ELISA_FIXTURE, export)),
+        "excel_wrapper[xlsx]":(ExcelWrapper, lambda: (WORKBOOK_FIXTURE,)),
+        "extraction[elisa]":(lambda groups: em.extract_values(Plate(readings), groups), lambda: (elisa_groups(),)),
+        "extraction[standards]":(lambda samples, standards: es.extract_duplicates(Plate(readings), samples, standards), standards_samples),
+        "regression[log-linear]":(fit_curves, lambda: ("log-linear", standard_conc, standard_ods)),
+        "regression[4PL]":(fit_curves, lambda: ("4PL", standard_conc, standard_ods)),
+        f"regression[4PL x{BATCH_PLATES}]":(fit_curves, lambda: ("4PL", batch_conc, batch_ods)),
+        f"regression[5PL x{BATCH_PLATES}]":(fit_curves, lambda: ("5PL", batch_conc, batch_ods)),
+        "excel_write":(lambda ewrapper, filename: ewrapper.write_excel(filename), filled_wrapper),
+        "prism_template":(PrismTemplate, lambda: (ELISA_TEMPLATE, TEMPLATE_STRUCTURES[ELISA_TEMPLATE])),
+        "prism_write":(template.write, lambda: (os.path.join(output_dir, "stage.pzfx"), bindings)),
+    }
+
+def measure(function:Callable[..., Any], setup:Callable[[], tuple], repeat:int)->dict[str, float]:
+    '''Times repeat calls of function after one warm up call and measures its peak memory in one more call'''
+    function(*setup())
+    seconds = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    args = setup()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    p95 = statistics.quantiles(seconds, n=20, method="inclusive")[-1] if len(seconds) > 1 else seconds[0]
+    return {"median_ms":statistics.median(seconds)*1000, "p95_ms":p95*1000, "min_ms":min(seconds)*1000, "peak_kib":peak/1024}
+
+def benchmark(repeat:int, patterns:list[str]|None = None)->dict:
+    with tempfile.TemporaryDirectory() as output_dir:
+        selected = {name:stage for name, stage in stages(output_dir).items() if not patterns or any(fnmatch.fnmatch(name, pattern) for pattern in patterns)}
+        results = {name:measure(function, setup, repeat) for name, (function, setup) in selected.items()}
+    return {
+        "repeat":repeat,
+        "python":sys.version.split()[0],
+        "numpy":np.__version__,
+        "stages":results,
+    }
+
+def compare(report:dict, baseline:dict, tolerance:float)->list[str]:
+    '''Prints the change of every median against the baseline and returns the stages that got slower than the tolerance'''
+    slower = []
+    print("change of the median against the baseline:")
+    for name, result in report["stages"].items():
+        if name not in baseline["stages"]: continue
+        ratio = result["median_ms"]/baseline["stages"][name]["median_ms"]
+        if ratio > 1 + tolerance: slower.append(name)
+        print(f"    {name:<28}{ratio:>8.2f}x{'  SLOWER' if name in slower else ''}")
+    return slower
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Times every stage of the pipelines on the fixtures in Tests/")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="number of timed runs of every stage")
+    parser.add_argument("-s", "--stage", action="append", help="only run the stages matching this fnmatch pattern, can be repeated")
+    parser.add_argument("--json", help="also write the results to this json file")
+    parser.add_argument("--compare", help="json file of a previous run to compare the medians against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown of a median against --compare, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.repeat, args.stage)
+    print(f"{'stage':<28}{'median':>10}{'p95':>10}{'peak':>12}")
+    for name, result in report["stages"].items():
+        print(f"{name:<28}{result['median_ms']:>8.2f}ms{result['p95_ms']:>8.2f}ms{result['peak_kib']:>9.0f}KiB")
+    if args.json:
+        with open(args.json, "w") as json_file: json.dump(report, json_file, indent=1)
+    if args.compare:
+        with open(args.compare) as json_file: baseline = json.load(json_file)
+        if compare(report, baseline, args.tolerance): return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+'''Startup benchmark of the GUI, launches main.py in fresh interpreters and reports the time until the first window is painted
+and the import cost of the heaviest modules
+
+    python Benchmarks/startup.py --runs 10
+    python Benchmarks/startup.py --runs 10 --json startup.json
+
+Every run is a new process so nothing is cached between runs except by the operating system, the first run is a warm up
+and is left out of the results. Qt is started with the offscreen platform unless QT_QPA_PLATFORM is already set.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child, prints the seconds between the interpreter starting and the first paint of the window
+CHILD = '''
+import time
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+import main
+app = main.dark_theme(QApplication([]))
+window = main.StackedPage()
+def shown():
+    print("FIRST_WINDOW", time.time())
+    app.quit()
+QTimer.singleShot(0, shown)
+app.exec_()
+'''
+
+def parse_importtime(stderr:str)->dict[str, float]:
+    '''Returns the cumulative import time in seconds of every package from the output of python -X importtime. The output lists
+    a module after everything it imported, indented by depth, so it is walked backwards to know which package imported which.
+    A package is counted where it is entered from another package, the time of its own submodules is already in that figure'''
+    costs = {}
+    parents = []
+    for line in reversed(stderr.splitlines()):
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit(): continue
+        depth = len(name) - len(name.lstrip())
+        package = name.strip().split(".")[0]
+        while parents and parents[-1][0] >= depth: parents.pop()
+        if not parents or parents[-1][1] != package: costs[package] = costs.get(package, 0) + int(cumulative.strip())/1e6
+        parents.append((depth, package))
+    return costs
+
+def run_once()->tuple[float, dict[str, float]]:
+    '''Starts the GUI in a new interpreter and returns the time to the first window and the import cost per package'''
+    env = {**os.environ, "QT_QPA_PLATFORM":os.environ.get("QT_QPA_PLATFORM", "offscreen")}
+    start = time.time()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    shown = [line for line in child.stdout.splitlines() if line.startswith("FIRST_WINDOW")]
+    if child.returncode or not shown: raise RuntimeError(f"The GUI did not start:\n{child.stderr[-2000:]}")
+    return float(shown[0].split()[1]) - start, parse_importtime(child.stderr)
+
+def benchmark(runs:int)->dict:
+    run_once()
+    results = [run_once() for _ in range(runs)]
+    first_window = [seconds for seconds, _ in results]
+    packages = {name for _, costs in results for name in costs}
+    imports = {name:statistics.median([costs.get(name, 0) for _, costs in results]) for name in packages}
+    return {
+        "runs":runs,
+        "python":sys.version.split()[0],
+        "first_window":{"median":statistics.median(first_window), "min":min(first_window), "max":max(first_window)},
+        "imports":dict(sorted(imports.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Measures the time to the first window of main.py and the import cost per module")
+    parser.add_argument("-r", "--runs", type=int, default=10, help="number of measured launches")
+    parser.add_argument("-t", "--top", type=int, default=15, help="number of modules listed")
+    parser.add_argument("--json", help="also write the results to this json file")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.runs)
+    first_window = report["first_window"]
+    print(f"time to first window: {first_window['median']*1000:.0f} ms median ({first_window['min']*1000:.0f}-{first_window['max']*1000:.0f} ms) over {args.runs} runs")
+    print("import cost (cumulative, median):")
+    for name, seconds in list(report["imports"].items())[:args.top]: print(f"    {name:<28}{seconds*1000:>8.1f} ms")
+    if args.json:
+        with open(args.json, "w") as json_file: json.dump(report, json_file, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
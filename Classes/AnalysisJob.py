@@ -0,0 +1,41 @@
+from PyQt5.QtCore import QRunnable
+from typing import Any, Callable
+
+class JobCancelled(Exception):
+    '''Raised from the progress callback of a cancelled job so the pipeline stops before its next stage'''
+
+class AnalysisJob(QRunnable):
+
+    def __init__(self, job_id:int, name:str, queue:"AnalysisQueue", function:Callable, *args:Any, **kwargs:Any):
+        '''Runs one pipeline on a QThreadPool thread, the pipeline is called with progress=self.report and the outcome is
+        emitted through the signals of the queue which are delivered on the GUI thread'''
+        super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
+        self.name = name
+        self.queue = queue
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_requested = False
+
+    def report(self, stage:str, step:int, steps:int)->None:
+        '''Progress callback of the pipeline, stops the pipeline if the job was cancelled'''
+        if self.cancel_requested: raise JobCancelled()
+        self.queue.progress.emit(self.job_id, stage, step, steps)
+        return None
+
+    def run(self)->None:
+        if self.cancel_requested:
+            self.queue.cancelled.emit(self.job_id)
+            return None
+        self.queue.started.emit(self.job_id)
+        try:
+            result = self.function(*self.args, progress=self.report, **self.kwargs)
+        except JobCancelled:
+            self.queue.cancelled.emit(self.job_id)
+        except Exception as error:
+            self.queue.failed.emit(self.job_id, f"{self.name} failed\n{type(error).__name__}: {error}")
+        else:
+            self.queue.finished.emit(self.job_id, result)
+        return None
@@ -0,0 +1,69 @@
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+from Classes.AnalysisJob import AnalysisJob
+from settings import *
+from typing import Any, Callable
+import itertools
+
+class AnalysisQueue(QObject):
+    queued = pyqtSignal(int, str)
+    started = pyqtSignal(int)
+    progress = pyqtSignal(int, str, int, int)
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+    def __init__(self, threads:int = ANALYSIS_THREADS):
+        '''Runs the analysis pipelines off the GUI thread, jobs past the number of threads wait in the queue in the order
+        they were submitted. Every signal carries the id that submit returned'''
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+        self.jobs:dict[int, AnalysisJob] = {}
+        self.callbacks:dict[int, Callable[[Any], None]] = {}
+        self.ids = itertools.count(1)
+        self.finished.connect(self.__finish)
+        self.failed.connect(lambda job_id, _: self.__forget(job_id))
+        self.cancelled.connect(self.__forget)
+
+    def submit(self, name:str, function:Callable, *args:Any, on_finished:Callable[[Any], None]|None = None, **kwargs:Any)->int:
+        '''Queues function(*args, progress=..., **kwargs), on_finished is called on the GUI thread with the result'''
+        job = AnalysisJob(next(self.ids), name, self, function, *args, **kwargs)
+        self.jobs[job.job_id] = job
+        if on_finished: self.callbacks[job.job_id] = on_finished
+        self.queued.emit(job.job_id, name)
+        self.pool.start(job)
+        return job.job_id
+
+    def cancel(self, job_id:int|None = None)->None:
+        '''Cancels one job or every job, a job that has not started is taken off the queue and a running job stops
+        before its next stage'''
+        jobs = list(self.jobs.values()) if job_id is None else [self.jobs[job_id]] if job_id in self.jobs else []
+        for job in jobs:
+            job.cancel_requested = True
+            if self.pool.tryTake(job): self.cancelled.emit(job.job_id)
+        return None
+
+    def name(self, job_id:int)->str:
+        return self.jobs[job_id].name if job_id in self.jobs else ""
+
+    def __len__(self)->int:
+        return len(self.jobs)
+
+    def __finish(self, job_id:int, result:Any)->None:
+        callback = self.callbacks.get(job_id)
+        self.__forget(job_id)
+        if callback: callback(result)
+        return None
+
+    def __forget(self, job_id:int)->None:
+        self.jobs.pop(job_id, None)
+        self.callbacks.pop(job_id, None)
+        return None
+
+_queue:AnalysisQueue|None = None
+
+def get_queue()->AnalysisQueue:
+    '''Returns the queue shared by every page, it is created on first use from the GUI thread'''
+    global _queue
+    if _queue is None: _queue = AnalysisQueue()
+    return _queue
@@ -0,0 +1,252 @@
+from dataclasses import dataclass
+from Classes.ConnectionPool import get_pool
+from settings import *
+import functools
+import numpy as np
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    cohort TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    is_control BOOLEAN NOT NULL,
+    normalizedod REAL,
+    rawod REAL,
+    excluded BOOLEAN NOT NULL DEFAULT 0,
+    UNIQUE (cohort, position)
+);
+CREATE INDEX IF NOT EXISTS samples_by_cohort ON samples (cohort, is_control, excluded, position, label, normalizedod);
+CREATE INDEX IF NOT EXISTS samples_by_label ON samples (label);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL UNIQUE,
+    pipeline TEXT NOT NULL,
+    source TEXT NOT NULL,
+    source_digest TEXT,
+    output TEXT,
+    cohort TEXT,
+    saved TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    condition TEXT NOT NULL DEFAULT '',
+    is_control BOOLEAN NOT NULL,
+    rawod REAL,
+    raw_cutoff REAL,
+    normalizedod REAL,
+    normalized_cutoff REAL,
+    flu_rlu REAL,
+    flu_rlu_cutoff REAL,
+    PRIMARY KEY (run, label, condition)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_label ON results (label, condition);
+'''
+
+# First and last sample label, sample and control counts of every cohort in a single pass over the samples table
+SUMMARY_QUERY = '''
+SELECT cohort, first_sample, last_sample, samples, controls FROM (
+    SELECT cohort, MIN(id) AS added, SUM(NOT is_control) AS samples, SUM(is_control) AS controls FROM samples GROUP BY cohort
+) LEFT JOIN (
+    SELECT DISTINCT cohort, FIRST_VALUE(label) OVER cohort_rows AS first_sample, LAST_VALUE(label) OVER cohort_rows AS last_sample
+    FROM samples WHERE is_control = 0
+    WINDOW cohort_rows AS (PARTITION BY cohort ORDER BY position ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+) USING (cohort) ORDER BY added
+'''
+
+# Every row of one cohort in plate order, read once per cohort into a CohortRecords
+COHORT_QUERY = "SELECT label, is_control, excluded, normalizedod, rawod FROM samples WHERE cohort = ? ORDER BY position"
+
+INSERT_SAMPLE = "INSERT INTO samples (cohort, position, label, is_control, normalizedod, rawod, excluded) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Saving a run again under the same run_id replaces its provenance and results
+UPSERT_RUN = '''
+INSERT INTO runs (run_id, pipeline, source, source_digest, output, cohort) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (run_id) DO UPDATE SET pipeline = excluded.pipeline, source = excluded.source, source_digest = excluded.source_digest,
+    output = excluded.output, cohort = excluded.cohort, saved = CURRENT_TIMESTAMP
+RETURNING id
+'''
+UPSERT_RESULT = '''
+INSERT INTO results (run, label, condition, is_control, rawod, raw_cutoff, normalizedod, normalized_cutoff, flu_rlu, flu_rlu_cutoff)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (run, label, condition) DO UPDATE SET is_control = excluded.is_control, rawod = excluded.rawod, raw_cutoff = excluded.raw_cutoff,
+    normalizedod = excluded.normalizedod, normalized_cutoff = excluded.normalized_cutoff, flu_rlu = excluded.flu_rlu, flu_rlu_cutoff = excluded.flu_rlu_cutoff
+'''
+UPDATE_SAMPLE_ODS = "UPDATE samples SET normalizedod = ?, rawod = ? WHERE cohort = ? AND label = ?"
+
+# Raw OD or FLU/RLU of the MIR controls of every run of a pipeline in the order the runs were saved, in local time
+CONTROL_QUERY = '''
+SELECT runs.run_id, datetime(runs.saved, 'localtime'), runs.source, results.condition, COALESCE(results.flu_rlu, results.rawod)
+FROM runs JOIN results ON results.run = runs.id
+WHERE runs.pipeline = ? AND results.is_control AND results.label LIKE ? || '%'
+ORDER BY runs.id
+'''
+
+def sample_rows(cohort:str, rows:list[tuple])->list[tuple]:
+    '''Turns (label, normalizedod, rawod, excluded) rows in plate order into samples rows, the position is the index of the row
+    and labels starting with the CONTROL_PREFIX are marked as controls'''
+    return [(cohort, position, str(label), str(label).upper().startswith(CONTROL_PREFIX), normalizedod, rawod, bool(excluded))
+            for position, (label, normalizedod, rawod, excluded) in enumerate(rows)]
+
+@dataclass
+class CohortSummary:
+    cohort:str
+    first_sample:str|None
+    last_sample:str|None
+    samples:int
+    controls:int
+
+@dataclass
+class SampleResult:
+    '''The result of one sample or control of a run, condition tells apart the halves of a neutralization plate'''
+    label:str
+    is_control:bool
+    condition:str = ""
+    rawod:float|None = None
+    raw_cutoff:float|None = None
+    normalizedod:float|None = None
+    normalized_cutoff:float|None = None
+    flu_rlu:float|None = None
+    flu_rlu_cutoff:float|None = None
+
+@dataclass
+class CohortRecords:
+    '''The rows of one cohort in plate order as arrays, missing ODs are NaN'''
+    cohort:str
+    labels:np.ndarray
+    is_control:np.ndarray
+    excluded:np.ndarray
+    normalized_ods:np.ndarray
+    raw_ods:np.ndarray
+
+    def mask(self, controls:bool = False, include_excluded:bool = False)->np.ndarray:
+        '''Returns the rows of the samples, or of the MIR controls, leaving out the excluded ones unless asked for'''
+        return (self.is_control == controls) & (include_excluded | ~self.excluded)
+
+class CohortDatabase:
+
+    def __init__(self, filepath:str = DATABASE):
+        '''Thin query layer over the samples table, every cohort is a set of rows in the one table and all the values
+        are passed to sqlite as bound parameters. No connection is opened until the first query, the connections come from
+        the ConnectionPool of the file so the same instance can be used from any thread or worker process'''
+        self.filepath = filepath
+        self.pool = get_pool(filepath)
+        self.__summary = (None, [])
+        self.__records:dict[str, CohortRecords] = {}
+        self.__seen = threading.local()
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__schema_ready = False
+
+    def create_schema(self)->None:
+        '''Creates the samples table and its indexes if they are missing'''
+        self.pool.connection(read_only=False).executescript(SCHEMA)
+        return None
+
+    def cohorts(self)->list[str]:
+        '''Returns the names of the cohorts in the order they were added'''
+        return [row[0] for row in self.pool.execute("SELECT cohort FROM samples GROUP BY cohort ORDER BY MIN(id)")]
+
+    def version(self)->tuple[int, int]:
+        '''Changes whenever the database is written to, data_version counts the commits made through any other connection,
+        including the read-write connection of the pool, and is only comparable on the same connection'''
+        connection = self.pool.connection()
+        return id(connection), connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def summary(self)->list[CohortSummary]:
+        '''Returns the summary of every cohort in the order they were added, the result is kept until the database changes'''
+        version = self.version()
+        if self.__summary[0] != version: self.__summary = (version, [CohortSummary(*row) for row in self.pool.execute(SUMMARY_QUERY)])
+        return self.__summary[1]
+
+    def records(self, cohort:str)->CohortRecords:
+        '''Returns every row of the cohort, a cohort is read with one query and kept until the database changes. data_version
+        is only comparable on one connection and every thread has its own, so each thread remembers the version it last saw
+        and drops the records of every thread when its version moved'''
+        version = self.version()
+        with self.__lock:
+            if getattr(self.__seen, "version", None) != version:
+                self.__clear()
+                self.__seen.version = version
+            if cohort in self.__records: return self.__records[cohort]
+            generation = self.__generation
+        rows = self.pool.execute(COHORT_QUERY, (cohort,)).fetchall()
+        labels = np.empty(len(rows), dtype=object)
+        labels[:] = [row[0] for row in rows]
+        records = CohortRecords(
+            cohort,
+            labels,
+            np.array([row[1] for row in rows], dtype=bool),
+            np.array([row[2] for row in rows], dtype=bool),
+            np.array([row[3] for row in rows], dtype=np.float64),
+            np.array([row[4] for row in rows], dtype=np.float64),
+        )
+        with self.__lock:
+            # Records read while another thread dropped the cache may be stale, they are returned but not kept
+            if generation == self.__generation: self.__records[cohort] = records
+        return records
+
+    def labels(self, cohort:str, controls:bool = False, include_excluded:bool = False)->list[str]:
+        '''Returns the labels of the samples, or of the MIR controls, of the cohort in plate order'''
+        records = self.records(cohort)
+        return records.labels[records.mask(controls, include_excluded)].tolist()
+
+    def normalized_ods(self, cohort:str, controls:bool = False, include_excluded:bool = False)->list[float|None]:
+        '''Returns the normalized ELISA ODs of the samples, or of the MIR controls, of the cohort in plate order'''
+        records = self.records(cohort)
+        return [None if od != od else od for od in records.normalized_ods[records.mask(controls, include_excluded)].tolist()]
+
+    def add_cohort(self, cohort:str, rows:list[tuple[str, float|None, float|None, bool]])->None:
+        '''Adds a cohort from (label, normalizedod, rawod, excluded) rows in plate order'''
+        with self.pool.transaction() as connection: connection.executemany(INSERT_SAMPLE, sample_rows(cohort, rows))
+        self.forget()
+        return None
+
+    def save_run(self, run_id:str, pipeline:str, source:str, results:list[SampleResult], source_digest:str|None = None, output:str|None = None,
+                 cohort:str|None = None, update_cohort:bool = False)->int:
+        '''Upserts the provenance of a run and the results of its samples in one transaction and returns the id of the run. With
+        update_cohort the ODs of the labels the cohort already has are replaced by the ones of the run, no row is ever added to
+        the cohort since the neutralization plates are laid out from its labels'''
+        self.__ensure_schema()
+        with self.pool.transaction() as connection:
+            run = connection.execute(UPSERT_RUN, (run_id, pipeline, source, source_digest, output, cohort)).fetchone()[0]
+            connection.executemany(UPSERT_RESULT, [(run, str(result.label), result.condition, result.is_control, result.rawod, result.raw_cutoff, result.normalizedod,
+                                                    result.normalized_cutoff, result.flu_rlu, result.flu_rlu_cutoff) for result in results])
+            if cohort and update_cohort:
+                connection.executemany(UPDATE_SAMPLE_ODS, [(result.normalizedod, result.rawod, cohort, str(result.label)) for result in results])
+        self.forget()
+        return run
+
+    def control_results(self, pipeline:str)->list[tuple[str, str, str, str, float|None]]:
+        '''Returns (run_id, saved, source, condition, value) of the MIR controls of every saved run of the pipeline in the order
+        the runs were saved, the value is the raw OD of an ELISA and the FLU/RLU of a neutralization assay'''
+        self.__ensure_schema()
+        return self.pool.execute(CONTROL_QUERY, (pipeline, CONTROL_PREFIX)).fetchall()
+
+    def forget(self)->None:
+        '''Drops the cached cohorts, called after writing through this instance'''
+        with self.__lock: self.__clear()
+        return None
+
+    def __ensure_schema(self)->None:
+        '''The runs and results tables are created the first time they are used'''
+        if not self.__schema_ready:
+            self.create_schema()
+            self.__schema_ready = True
+        return None
+
+    def __clear(self)->None:
+        self.__records.clear()
+        self.__generation += 1
+        return None
+
+    def close(self)->None:
+        '''Closes the connections the calling thread opened'''
+        return self.pool.close()
+
+@functools.lru_cache(maxsize=None)
+def get_database(filepath:str = DATABASE)->CohortDatabase:
+    '''Returns the CohortDatabase of the file shared by every module of this process, so they share its cached cohorts'''
+    return CohortDatabase(filepath)
@@ -0,0 +1,85 @@
+from datetime import datetime
+import hashlib
+import numpy as np
+import os
+
+SIGNATURE_KEY = '__signature__'
+# Columns that are not all numbers are stored as three arrays, the kind of every cell and its value as a number or as text,
+# so the cache file never holds pickled objects
+KINDS_KEY = '{}.kinds'
+NUMBERS_KEY = '{}.numbers'
+TEXT_KEY = '{}.text'
+EMPTY, NUMBER, INTEGER, BOOLEAN, TEXT, DATETIME = range(6)
+
+def to_array(values:list)->np.ndarray:
+    '''Converts the values of a column to a float64 array with NaN for empty cells when every value is a number,
+    any other column is kept as an object array'''
+    if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+def encode(values:np.ndarray)->dict[str, np.ndarray]|None:
+    '''Splits an object column into its kinds, numbers and text arrays, None if a cell holds a value that can not be stored'''
+    kinds = np.full(len(values), EMPTY, dtype=np.int8)
+    numbers = np.full(len(values), np.nan, dtype=np.float64)
+    text = [""]*len(values)
+    for row, value in enumerate(values):
+        if value is None: continue
+        elif isinstance(value, bool): kinds[row], numbers[row] = BOOLEAN, value
+        elif isinstance(value, int): kinds[row], text[row] = INTEGER, str(value)
+        elif isinstance(value, float): kinds[row], numbers[row] = NUMBER, value
+        elif isinstance(value, str): kinds[row], text[row] = TEXT, value
+        elif isinstance(value, datetime): kinds[row], text[row] = DATETIME, value.isoformat()
+        else: return None
+    return {KINDS_KEY:kinds, NUMBERS_KEY:numbers, TEXT_KEY:np.array(text, dtype=str)}
+
+def decode(kinds:np.ndarray, numbers:np.ndarray, text:np.ndarray)->np.ndarray:
+    '''Puts an object column back together from the arrays of encode'''
+    values = [None if kind == EMPTY else float(number) if kind == NUMBER else int(string) if kind == INTEGER else bool(number) if kind == BOOLEAN
+              else string if kind == TEXT else datetime.fromisoformat(string) for kind, number, string in zip(kinds.tolist(), numbers.tolist(), text.tolist())]
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+class ColumnCache:
+
+    def __init__(self, filepath:str, cache_dir:str):
+        '''Keeps the columns extracted from a workbook in a .npz file, the cache is only used while the size and
+        modification time of the workbook are the ones it was built from'''
+        stat = os.stat(filepath)
+        self.signature = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        digest = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:12]
+        self.filepath = f"{cache_dir}/{os.path.basename(filepath)}.{digest}.npz"
+        self.cache_dir = cache_dir
+        self.columns:dict[str, np.ndarray] = self.__load()
+
+    def __load(self)->dict[str, np.ndarray]:
+        '''Returns the cached columns, a missing, stale or unreadable cache file is treated as empty. Nothing is unpickled, a
+        cache file written with object arrays can not be read and is rebuilt'''
+        try:
+            with np.load(self.filepath, allow_pickle=False) as cached:
+                if SIGNATURE_KEY not in cached or not np.array_equal(cached[SIGNATURE_KEY], self.signature): return {}
+                columns = {col:cached[col] for col in cached.files if col != SIGNATURE_KEY and "." not in col}
+                for col in {key.partition(".")[0] for key in cached.files if "." in key}:
+                    columns[col] = decode(cached[KINDS_KEY.format(col)], cached[NUMBERS_KEY.format(col)], cached[TEXT_KEY.format(col)])
+                return columns
+        except (OSError, ValueError, EOFError, KeyError):
+            return {}
+
+    def missing(self, cols:list[str])->list[str]:
+        return [col for col in cols if col not in self.columns]
+
+    def update(self, columns:dict[str, np.ndarray])->None:
+        '''Adds the columns and rewrites the cache file, the file is replaced atomically. A column holding a value encode can
+        not store is only kept in memory'''
+        self.columns.update(columns)
+        arrays = {SIGNATURE_KEY:self.signature}
+        for col, values in self.columns.items():
+            if values.dtype != object: arrays[col] = values
+            elif (encoded := encode(values)) is not None: arrays.update({key.format(col):array for key, array in encoded.items()})
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(f"{self.filepath}.tmp", "wb") as cache_file: np.savez(cache_file, **arrays)
+        os.replace(f"{self.filepath}.tmp", self.filepath)
+        return None
@@ -0,0 +1,82 @@
+from openpyxl import Workbook
+from typing import Any, Iterator
+import functools
+import string
+
+# Last column of an Excel worksheet, XFD
+MAX_COLUMNS = 16384
+
+@functools.lru_cache(maxsize=None)
+def column_table()->tuple[list[str], dict[str, int]]:
+    '''Builds the letters of every worksheet column once, returns the letters in order and the 1-based index of each letter'''
+    letters = []
+    for index in range(1, MAX_COLUMNS+1):
+        letter = ""
+        while index:
+            index, remainder = divmod(index-1, 26)
+            letter = string.ascii_uppercase[remainder] + letter
+        letters.append(letter)
+    return letters, {letter:index for index, letter in enumerate(letters, 1)}
+
+def column_index(col:str)->int:
+    '''Converts a column letter such as "A", "AA" or "XFD" to its 1-based index'''
+    try:
+        return column_table()[1][col.strip().upper()]
+    except KeyError:
+        raise ValueError(f"'{col}' is not a worksheet column")
+
+def column_letter(index:int)->str:
+    '''Converts a 1-based column index to its letter'''
+    if not 1 <= index <= MAX_COLUMNS: raise ValueError(f"{index} is not a worksheet column")
+    return column_table()[0][index-1]
+
+class ColumnarSheet:
+
+    def __init__(self, rows:list[list]|None = None, col_limit:int = 14):
+        '''Collects the output of an analysis as whole columns next to the rows of the export and only builds the worksheet
+        when it is saved, passing in a col_limit means that only items until the specified index of each row are kept'''
+        self.base = [row[:col_limit] for row in rows] if rows else []
+        self.columns:dict[int, list[Any]] = {}
+
+    @property
+    def max_row(self)->int:
+        return max([len(self.base)] + [len(values) for values in self.columns.values()])
+
+    @property
+    def max_column(self)->int:
+        return max([len(row) for row in self.base] + list(self.columns), default=0)
+
+    def add_column(self, col:str, data:Any, start_row:int = 1)->None:
+        '''Adds the data passed in to the column starting from start_row, lists, tuples and arrays are written one value per row
+        and a single value is written to every row until the last row of the sheet like ExcelWrapper.add_column'''
+        if hasattr(data, "tolist"): data = data.tolist()
+        if not isinstance(data, (list, tuple)): data = [data]*self.max_row
+        values = self.columns.setdefault(column_index(col), [])
+        end = start_row-1+len(data)
+        if len(values) < end: values.extend([None]*(end-len(values)))
+        values[start_row-1:end] = data
+        return None
+
+    def rows(self)->list[list[Any]]:
+        '''Returns the rows of the sheet with the added columns merged in, values added to a column replace the export's value'''
+        return list(self.iter_rows())
+
+    def iter_rows(self)->Iterator[list[Any]]:
+        '''Yields the rows of the sheet one at a time, trailing empty cells are left off'''
+        columns = sorted(self.columns.items())
+        width = self.max_column
+        for index in range(self.max_row):
+            row = [None]*width
+            if index < len(self.base): row[:len(self.base[index])] = self.base[index]
+            for col, values in columns:
+                if index < len(values) and values[index] is not None: row[col-1] = values[index]
+            while row and row[-1] is None: row.pop()
+            yield row
+
+    def save(self, destination:str)->None:
+        '''Streams the rows to the destination through a write-only workbook so the cells are never all held in memory'''
+        wkbk = Workbook(write_only=True)
+        wkst = wkbk.create_sheet()
+        for row in self.iter_rows(): wkst.append(row)
+        wkbk.save(destination)
+        return None
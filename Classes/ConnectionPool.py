@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from settings import *
+import functools
+import os
+import sqlite3
+import threading
+
+# Relative database paths are resolved against the repository, not the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Number of prepared statements sqlite3 keeps per connection, every query of the app is a constant string so they are all reused
+STATEMENT_CACHE = 256
+
+class ConnectionPool:
+
+    def __init__(self, filepath:str):
+        '''Hands out sqlite connections to a database file, every thread of every process gets its own connections which are only
+        opened the first time they are needed. Lookups go through a read-only connection and writes through a read-write
+        connection that switches the database to WAL so readers are never blocked by a writer'''
+        self.filepath = filepath if os.path.isabs(filepath) else os.path.join(REPO_DIR, filepath)
+        self.__local = threading.local()
+
+    def __connections(self)->dict[bool, sqlite3.Connection]:
+        '''Returns the connections of the calling thread, connections inherited from a parent process are dropped'''
+        if getattr(self.__local, "pid", None) != os.getpid():
+            self.__local.pid = os.getpid()
+            self.__local.connections = {}
+        return self.__local.connections
+
+    def connection(self, read_only:bool = True)->sqlite3.Connection:
+        '''Returns the read-only or read-write connection of the calling thread, opening it if needed'''
+        connections = self.__connections()
+        if read_only not in connections:
+            if read_only:
+                if not os.path.exists(self.filepath): raise FileNotFoundError(f"{self.filepath} does not exist")
+                # as_uri escapes the characters of the path that would end or change the uri, i.e "?", "#" and "%"
+                connection = sqlite3.connect(f"{Path(self.filepath).as_uri()}?mode=ro", uri=True, cached_statements=STATEMENT_CACHE)
+            else:
+                connection = sqlite3.connect(self.filepath, cached_statements=STATEMENT_CACHE, isolation_level=None)
+                connection.execute("PRAGMA journal_mode=WAL")
+            connections[read_only] = connection
+        return connections[read_only]
+
+    def execute(self, sql:str, parameters:tuple|dict = ())->sqlite3.Cursor:
+        '''Runs a lookup on the read-only connection, the statement is prepared once per connection and reused'''
+        return self.connection().execute(sql, parameters)
+
+    @contextmanager
+    def transaction(self)->Iterator[sqlite3.Connection]:
+        '''Lends out the read-write connection inside a transaction that is committed when the block exits or rolled back if it
+        raises, the write lock is taken up front so two writers never deadlock half way through'''
+        connection = self.connection(read_only=False)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self)->None:
+        '''Closes the connections of the calling thread'''
+        for connection in self.__connections().values(): connection.close()
+        self.__connections().clear()
+        return None
+
+@functools.lru_cache(maxsize=None)
+def get_pool(filepath:str = DATABASE)->ConnectionPool:
+    '''Returns the one ConnectionPool of the database file in this process'''
+    return ConnectionPool(filepath)
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from Classes.CohortDatabase import CohortDatabase, get_database
+from numpy.lib.stride_tricks import sliding_window_view
+from settings import *
+import functools
+import numpy as np
+import warnings
+
+# Westgard rules checked on the Levey-Jennings z-score of the control mean of every plate, 1_2s is only a warning
+WESTGARD_RULES = ("1_2s", "1_3s", "2_2s", "R_4s", "4_1s", "10_x")
+WARNING_RULES = ("1_2s",)
+# Plates of history needed before a plate is scored against the running window
+MIN_HISTORY = 3
+SD_TOLERANCE = 1e-12
+
+def nan_quiet(function):
+    '''Runs a nan-aware reduction without the warnings numpy raises for windows that are all NaN'''
+    @functools.wraps(function)
+    def quiet(*args, **kwargs):
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return function(*args, **kwargs)
+    return quiet
+
+def median(controls:np.ma.MaskedArray)->np.ndarray:
+    '''Returns the median of the kept controls of every row, NaN if a kept control is NaN or no control is kept'''
+    kept = ~np.ma.getmaskarray(controls)
+    if kept.all(): return np.median(np.ma.getdata(controls), axis=1)
+    missing = np.any(np.isnan(np.ma.getdata(controls)) & kept, axis=1) | ~kept.any(axis=1)
+    return np.where(missing, np.nan, np.ma.filled(np.ma.median(controls, axis=1), np.nan))
+
+@nan_quiet
+def plate_cutoffs(assay:str, controls:np.ndarray)->np.ndarray:
+    '''Returns the cutoff of every row of a plates x controls array. ELISA cutoffs are median + 3*stdev of the MIR controls and
+    neutralization cutoffs 0.15*median, according to the 2021 Bastard paper. A NaN control makes the cutoff of its row NaN,
+    only the masked entries of a masked array (i.e the padding of rows with fewer controls) are left out'''
+    controls = np.ma.atleast_2d(np.ma.asarray(controls, dtype=np.float64))
+    kept = ~np.ma.getmaskarray(controls)
+    if assay == "elisa": return median(controls) + 3*np.std(np.ma.getdata(controls), axis=1, ddof=1, where=kept)
+    if assay == "neutralization": return median(controls)*0.15
+    raise ValueError(f"No cutoff rule for '{assay}', expected elisa or neutralization")
+
+def trailing_windows(values:np.ndarray, window:int, include_current:bool = True)->np.ma.MaskedArray:
+    '''Returns the window of plates ending at every plate (or just before it) as a plates x window*controls array, the
+    windows of the first plates are padded with masked entries'''
+    values = np.ma.asarray(values)
+    data = np.ma.getdata(values).reshape(len(values), -1)
+    mask = np.ma.getmaskarray(values).reshape(len(values), -1)
+    padding = window - 1 if include_current else window
+    windows = lambda array, fill: sliding_window_view(np.concatenate([np.full((padding, array.shape[1]), fill), array]), window, axis=0)[:len(values)].reshape(len(values), -1)
+    return np.ma.MaskedArray(windows(data, np.nan), mask=windows(mask, True))
+
+def consecutive(condition:np.ndarray, count:int)->np.ndarray:
+    '''True for the plates that end a run of count consecutive plates meeting the condition'''
+    padded = np.concatenate([np.zeros(count - 1, dtype=bool), condition])
+    return sliding_window_view(padded, count).all(axis=1)
+
+def westgard(z:np.ndarray)->dict[str, np.ndarray]:
+    '''Applies the Westgard rules to a series of z-scores, NaN scores never break a rule'''
+    above = lambda limit: np.nan_to_num(z, nan=0) > limit
+    below = lambda limit: np.nan_to_num(z, nan=0) < -limit
+    previous = np.concatenate([[np.nan], z[:-1]])
+    return {
+        "1_2s":above(2) | below(2),
+        "1_3s":above(3) | below(3),
+        "2_2s":consecutive(above(2), 2) | consecutive(below(2), 2),
+        "R_4s":np.nan_to_num(np.abs(z - previous), nan=0) > 4,
+        "4_1s":consecutive(above(1), 4) | consecutive(below(1), 4),
+        "10_x":consecutive(above(0), 10) | consecutive(below(0), 10),
+    }
+
+@dataclass
+class ControlQC:
+    '''QC of a series of plates in run order, every array has one value per plate'''
+    assay:str
+    window:int
+    cutoffs:np.ndarray
+    means:np.ndarray
+    rolling_cutoffs:np.ndarray
+    rolling_means:np.ndarray
+    rolling_sds:np.ndarray
+    z:np.ndarray
+    flags:dict[str, np.ndarray]
+
+    def __len__(self)->int:
+        return len(self.means)
+
+    @property
+    def rejected(self)->np.ndarray:
+        '''Plates breaking any Westgard rule other than the warnings'''
+        return np.any([flags for rule, flags in self.flags.items() if rule not in WARNING_RULES], axis=0)
+
+    @property
+    def warned(self)->np.ndarray:
+        return np.any([self.flags[rule] for rule in WARNING_RULES], axis=0) & ~self.rejected
+
+    def rules(self, plate:int)->list[str]:
+        '''Returns the rules the plate breaks'''
+        return [rule for rule, flags in self.flags.items() if flags[plate]]
+
+@nan_quiet
+def control_qc(assay:str, controls:np.ndarray, window:int = QC_WINDOW)->ControlQC:
+    '''Computes the cutoff and control mean of every plate of a plates x controls array in run order (missing controls are
+    NaN, a masked array leaves out its masked controls) together with the cutoff of the controls of the last window plates.
+    The control mean of every plate is scored against the mean and standard deviation of the control means of the window
+    plates before it, the Levey-Jennings z-score, and the Westgard rules are applied to the scores. A plate with a missing
+    control has no mean or cutoff and is left out of the windows of the plates after it, plates with fewer than
+    MIN_HISTORY plates before them are not scored'''
+    controls = np.ma.atleast_2d(np.ma.asarray(controls, dtype=np.float64))
+    kept = ~np.ma.getmaskarray(controls)
+    means = np.where(kept.any(axis=1), np.mean(np.ma.getdata(controls), axis=1, where=kept), np.nan)
+    missing = np.isnan(means)
+    history = trailing_windows(np.ma.MaskedArray(means, mask=missing), window, include_current=False)
+    counted = history.count(axis=1) >= MIN_HISTORY
+    rolling_means = np.where(counted, np.ma.filled(history.mean(axis=1), np.nan), np.nan)
+    rolling_sds = np.where(counted, np.ma.filled(history.std(axis=1, ddof=1), np.nan), np.nan)
+    # A window of identical means leaves rounding noise as its standard deviation, it scores nothing
+    z = (means - rolling_means)/np.where(rolling_sds > SD_TOLERANCE*np.abs(rolling_means), rolling_sds, np.nan)
+    windows = trailing_windows(np.ma.MaskedArray(np.ma.getdata(controls), mask=~kept | missing[:, None]), window)
+    return ControlQC(assay, window, plate_cutoffs(assay, controls), means, plate_cutoffs(assay, windows),
+                     rolling_means, rolling_sds, z, westgard(z))
+
+@dataclass
+class PlateRun:
+    run_id:str
+    saved:str
+    source:str
+
+def run_history(pipeline:str, window:int = QC_WINDOW, database:CohortDatabase|None = None)->dict[str, tuple[list[PlateRun], ControlQC]]:
+    '''Returns the runs and the ControlQC of every saved run of the pipeline, read from the results of the MIR controls, with
+    one series per condition since each half of a neutralization plate has its own stimulation'''
+    series:dict[str, dict[str, tuple[PlateRun, list[float|None]]]] = {}
+    for run_id, saved, source, condition, value in (database or get_database()).control_results(pipeline):
+        series.setdefault(condition, {}).setdefault(run_id, (PlateRun(run_id, saved, source), []))[1].append(value)
+    history = {}
+    for condition, runs in series.items():
+        # Runs with fewer controls are padded with masked entries, a control saved without a value is NaN
+        controls = np.ma.masked_all((len(runs), max(len(values) for _, values in runs.values())), dtype=np.float64)
+        for row, (_, values) in enumerate(runs.values()): controls[row, :len(values)] = [np.nan if value is None else value for value in values]
+        history[condition] = ([run for run, _ in runs.values()], control_qc(pipeline, controls, window))
+    return history
@@ -1,34 +1,39 @@
 from openpyxl import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.cell.cell import Cell
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.PlateCache import load_export
+from Classes.ColumnarSheet import ColumnarSheet, column_index
+from Classes.ColumnCache import ColumnCache, to_array
+from Classes.Plate import reduce_replicates, replicate_blocks
+from settings import *
+import numpy as np
 import openpyxl
 from typing import Any, Callable
-import csv
 
 
 class ExcelWrapper:
 
-    def __init__(self, filepath:str):
-        '''Takes in a text file and produces and excel file or takes a an excel filepath'''
+    def __init__(self, filepath:str, export:SoftMaxExport|None = None, read_only:bool = False):
+        '''Takes in a text file and produces and excel file or takes a an excel filepath, an already parsed
+        SoftMaxExport of the text file can be passed in so the file is only decoded once, otherwise it comes from the PlateCache. The output of a text file is
+        collected column by column and streamed out by write_excel, the worksheet is only built if a cell is asked for.
+        An excel file opened with read_only is streamed instead of loaded and the columns read from it are cached on disk'''
+        self.cache = None
         if filepath.find(".txt") >= 0:
-            self.wkbk, self.wkst = self.__create_excel(self.__get_data(filepath))
+            self.export = export if export else load_export(filepath)
+            self.sheet = ColumnarSheet(self.export.rows)
+            self.wkbk = self.__wkst = None
         elif filepath.find(".xlsx") >= 0:
-            self.wkbk = openpyxl.load_workbook(filepath)
-            self.wkst = self.wkbk.active
+            self.export = None
+            self.sheet = None
+            self.wkbk = openpyxl.load_workbook(filepath, read_only=read_only, data_only=read_only)
+            self.__wkst = self.wkbk.active
+            if read_only: self.cache = ColumnCache(filepath, COLUMN_CACHE_DIR)
         else:
             raise ValueError
         self.filepath = filepath
 
-    def __get_data(self, filepath:str)->list[list]:
-        '''Gets the data from a utf-16 encoded text file and returns it as a list of lists'''
-        data = []
-
-        with open(filepath, "r", encoding="utf-16") as raw_file:
-            raw_data = csv.DictReader(raw_file, delimiter="\t")
-            for row_dict in raw_data: data.append([val for val in row_dict.values()])
-
-        return [self.__flatten_list(item) for item in data]
-    
     def __create_excel(self,data:list[list], col_limit = 14)->tuple[Workbook, Worksheet]:
         '''Appends each list within the list argument to an excel worksheet, passing in a col_limit means that only
         items until the specified index are appended to the excel worksheet'''
@@ -36,23 +41,22 @@ class ExcelWrapper:
         wkst:Worksheet = wkbk.active
         for row in data: wkst.append(row[:col_limit])
         return wkbk, wkst
-    
-    def __flatten_list(self, lists:list)->list:
-        '''flattens inner lists into 1 list, goes 1 level deep only'''
-        flattened = []
-        for item in lists:
-            if type(item) == list:
-                for inner_item in item: flattened.append(inner_item)
-            else:
-                flattened.append(item)
-            
-        return flattened
+
+    @property
+    def wkst(self)->Worksheet:
+        '''The in memory worksheet, for a text file it is built from the columns added so far the first time it is used and
+        the wrapper keeps working cell by cell from then on'''
+        if self.__wkst is None:
+            self.wkbk, self.__wkst = self.__create_excel(self.sheet.rows(), col_limit=None)
+            self.sheet = None
+        return self.__wkst
     
     def add_column(self, col:str, data:str|list, start_row:int = 1)->None:
         '''Adds the data passed in to all the cells in the column, if a single value is passed in all cells
-        in that column will have that value starting from start_row'''
-        col = col.upper()
-        col_index = ord(col) - ord("A")+1 if len(col) == 1 else (ord("Z") - ord("A")+1)+ord(col[-1]) - ord("A")+1
+        in that column will have that value starting from start_row. Any column letter can be used, i.e "AA" or "XFD"'''
+        if self.sheet is not None: return self.sheet.add_column(col, data, start_row)
+        col_index = column_index(col)
+        if hasattr(data, "tolist"): data = data.tolist()
         
         limit = len(data) if isinstance(data, list) else self.wkst.max_row
         if not isinstance(data, list): data = [data]*limit
@@ -99,27 +103,50 @@ class ExcelWrapper:
 
     def get_column(self, col:str, start_row = 1, end_row:int = 0, values_only = False)->list[Cell|Any]:
         '''Gets the cells in a specified column in descending order'''
-        col = col.upper()
-        col_index = ord(col) - ord("A")+1 if len(col) == 1 else (ord("Z") - ord("A")+1)+ord(col[-1]) - ord("A")+1
+        col_index = column_index(col)
         last_row = end_row if end_row > start_row else self.wkst.max_row
+        if values_only and self.cache is not None:
+            values = self.get_columns([col], start_row)[col.upper()]
+            return values[:max(last_row-start_row, 0)].tolist()
         return [self.wkst.cell(row, col_index) if not values_only else self.wkst.cell(row, col_index).value for row in range(start_row,last_row)]
 
-    def apply_to_adj_columns(self, cell_matrix:list[Cell], foo:Callable, col_height = 8)->list[str|int|float]:
+    def get_columns(self, cols:list[str], start_row:int = 1, end_row:int = 0)->dict[str, np.ndarray]:
+        '''Returns the values of the columns from start_row up to but not including end_row, or until the last row if end_row is
+        not after start_row. Columns of numbers are float64 arrays with NaN for empty cells, others are object arrays.
+        All the columns that are not cached are read in a single pass over the rows'''
+        cols = [col.upper() for col in cols]
+        columns = self.cache.columns if self.cache is not None else {}
+        missing = [col for col in cols if col not in columns]
+        if missing:
+            indices = [column_index(col) for col in missing]
+            first = min(indices)
+            values = {col:[] for col in missing}
+            for row in self.wkst.iter_rows(min_col=first, max_col=max(indices), values_only=True):
+                for col, index in zip(missing, indices): values[col].append(row[index-first] if index-first < len(row) else None)
+            read = {col:to_array(vals) for col, vals in values.items()}
+            if self.cache is not None: self.cache.update(read)
+            else: columns = read
+        last = end_row-1 if end_row > start_row else None
+        projected = {col:columns[col][start_row-1:last] for col in cols}
+        # A column with a header row is an object array, the rows below the header are converted again so they can be numbers
+        return {col:to_array(values.tolist()) if values.dtype == object else values for col, values in projected.items()}
+
+    def apply_to_adj_columns(self, cell_matrix:list[Cell], foo:str|np.ufunc|Callable, col_height = 8)->list[str|int|float]:
         '''Applies the function to each cell value and its adjacent cell value in the cell matrix, its adjacent is calculated
-        by adding the col_height to the first index'''
-        results = []
-        finished_indices = []
-        for index in range(len(cell_matrix)):
-            if index in finished_indices: continue
-            first_col = index
-            second_col = index+col_height
-            finished_indices.append(first_col)
-            finished_indices.append(second_col)
-            first_val = float(cell_matrix[first_col].value)
-            second_val = float(cell_matrix[second_col].value)
-            results.append(foo(first_val, second_val))
-        return results
+        by adding the col_height to the first index. foo can also be the name of one of the Plate REDUCERS or a numpy ufunc,
+        those are applied to every pair at once'''
+        values = np.array([float(cell.value) for cell in cell_matrix]).reshape(-1, col_height).T
+        pairs = replicate_blocks(values, 2)
+        if isinstance(foo, (str, np.ufunc)): return reduce_replicates(pairs, foo).tolist()
+        return [foo(first_val, second_val) for first_val, second_val in pairs.tolist()]
     
+    def close(self)->None:
+        '''Closes the file handle a read only workbook keeps open'''
+        if self.wkbk is not None: self.wkbk.close()
+        return None
+
     def write_excel(self, destination:str)->None:
-        self.wkbk.save(destination)
+        '''Saves the workbook, the columnar output of a text file is written in a single streaming pass'''
+        if self.sheet is not None: self.sheet.save(destination)
+        else: self.wkbk.save(destination)
         return None
\ No newline at end of file
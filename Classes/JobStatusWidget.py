@@ -0,0 +1,57 @@
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel, QProgressBar, QPushButton
+from Classes.AnalysisQueue import get_queue
+from Classes.ErrorMessageBox import ErrorMessageBox
+
+class JobStatusWidget(QWidget):
+    def __init__(self, parent:QWidget|None = None):
+        '''Shows the stage of the running analysis and the number of queued plates with a button to cancel them, errors
+        of any job are shown in an ErrorMessageBox'''
+        super().__init__(parent)
+        self.setLayout(QHBoxLayout())
+        self.status = QLabel("No analysis running")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.layout().addWidget(self.status)
+        self.layout().addWidget(self.progress_bar)
+        self.layout().addWidget(self.cancel_button)
+        self.names = {}
+
+        self.queue = get_queue()
+        self.queue.queued.connect(self.job_queued)
+        self.queue.progress.connect(self.job_progress)
+        self.queue.finished.connect(lambda job_id, _: self.job_done(job_id, "Finished"))
+        self.queue.failed.connect(self.job_failed)
+        self.queue.cancelled.connect(lambda job_id: self.job_done(job_id, "Cancelled"))
+        self.cancel_button.clicked.connect(lambda: self.queue.cancel())
+
+    def show_status(self, text:str)->None:
+        others = len(self.names)-1 if self.names else 0
+        self.status.setText(f"{text} ({others} more queued or running)" if others > 0 else text)
+        self.cancel_button.setEnabled(bool(self.names))
+        return None
+
+    def job_queued(self, job_id:int, name:str)->None:
+        self.names[job_id] = name
+        self.show_status(f"{name}: waiting")
+        return None
+
+    def job_progress(self, job_id:int, stage:str, step:int, steps:int)->None:
+        self.progress_bar.setRange(0, steps)
+        self.progress_bar.setValue(step)
+        self.show_status(f"{self.names.get(job_id, '')}: {stage}")
+        return None
+
+    def job_done(self, job_id:int, outcome:str)->None:
+        name = self.names.pop(job_id, "")
+        self.progress_bar.setValue(self.progress_bar.maximum() if outcome == "Finished" else 0)
+        self.show_status(f"{name}: {outcome}")
+        return None
+
+    def job_failed(self, job_id:int, message:str)->None:
+        self.job_done(job_id, "Failed")
+        # Only the page that is showing reports the error so it pops up once
+        if self.isVisible(): ErrorMessageBox(message)
+        return None
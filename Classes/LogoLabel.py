@@ -0,0 +1,15 @@
+from PyQt5.QtWidgets import QLabel, QWidget
+from PyQt5.QtGui import QPixmap
+from settings import *
+import functools
+
+@functools.lru_cache(maxsize=None)
+def logo_pixmap()->QPixmap:
+    '''Decodes and scales the logo once, every page shows the same pixmap'''
+    return QPixmap(LOGO_IMAGE).scaled(*LOGO_SIZE)
+
+class LogoLabel(QLabel):
+    def __init__(self, parent:QWidget|None = None):
+        '''Label showing the logo scaled to LOGO_SIZE'''
+        super().__init__(parent)
+        self.setPixmap(logo_pixmap())
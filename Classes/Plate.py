@@ -0,0 +1,141 @@
+from typing import Callable
+import numpy as np
+import string
+import warnings
+
+ROW_LETTERS = list(string.ascii_uppercase) + [f"A{letter}" for letter in string.ascii_uppercase]
+
+def row_index(letter:str)->int:
+    '''Converts a row letter, i.e "A" or "AF" on 1536 well plates, to a 0-based index'''
+    try:
+        return ROW_LETTERS.index(letter.strip().upper())
+    except ValueError:
+        raise ValueError(f"'{letter}' is not a row on the plate")
+
+def well_index(well:str)->tuple[int, int]:
+    '''Converts a well name such as "A1" or "P24" to a 0-based (row, column) index'''
+    well = well.strip().upper()
+    letters = well.rstrip(string.digits)
+    digits = well[len(letters):]
+    if not letters or not digits: raise ValueError(f"'{well}' is not a well name")
+    return row_index(letters), int(digits)-1
+
+# Reducers applied across the replicates of each sample, every one takes a samples x replicates array and the mask of the
+# wells that are kept. Only excluded wells are left out, a NaN well (an empty well of the export) makes its sample NaN
+REDUCERS:dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "mean":lambda values, kept: np.mean(values, axis=1, where=kept),
+    "std":lambda values, kept: np.std(values, axis=1, ddof=1, where=kept),
+    "cv":lambda values, kept: np.std(values, axis=1, ddof=1, where=kept)/np.mean(values, axis=1, where=kept),
+    "min":lambda values, kept: np.min(values, axis=1, where=kept, initial=np.inf),
+    "max":lambda values, kept: np.max(values, axis=1, where=kept, initial=-np.inf),
+}
+
+def replicate_blocks(block:np.ndarray, stride:int = 2)->np.ndarray:
+    '''Regroups a rows x columns block whose replicates sit in adjacent columns into a samples x stride array, the samples
+    are in column-major order i.e the rows of the first stride columns, then the rows of the next stride columns'''
+    block = np.asarray(block, dtype=np.float64)
+    rows, cols = block.shape
+    if cols % stride: raise ValueError(f"A block with {cols} columns can not be split into replicates of {stride} columns")
+    return block.reshape(rows, cols//stride, stride).transpose(1, 0, 2).reshape(-1, stride)
+
+def reduce_replicates(values:np.ndarray, *reducers:str|np.ufunc|Callable)->np.ndarray|dict[str, np.ndarray]:
+    '''Applies each reducer across the replicates (axis 1) of a samples x replicates array in one vectorized call. A reducer is
+    the name of one of the REDUCERS, a numpy ufunc (reduced with ufunc.reduce) or a function taking the whole array.
+    The masked wells of a masked array, i.e excluded wells from Plate.gather, are left out and a sample with no wells left
+    is NaN. Returns the reduced array for a single reducer, otherwise a dictionary keyed by the reducer names'''
+    data = np.asarray(np.ma.getdata(values), dtype=np.float64)
+    kept = ~np.ma.getmaskarray(values)
+    empty = ~kept.any(axis=1)
+    results = {}
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for reducer in reducers or ("mean",):
+            if isinstance(reducer, str): results[reducer] = np.where(empty, np.nan, REDUCERS[reducer](data, kept))
+            elif isinstance(reducer, np.ufunc):
+                if reducer.identity is None and not kept.all(): raise ValueError(f"{reducer.__name__} can not leave out masked wells, use one of the REDUCERS")
+                results[reducer.__name__] = np.where(empty, np.nan, reducer.reduce(data, axis=1, where=kept, initial=reducer.identity)) if not kept.all() else reducer.reduce(data, axis=1)
+            else: results[getattr(reducer, "__name__", str(reducer))] = np.asarray(reducer(values))
+    return next(iter(results.values())) if len(results) == 1 else results
+
+class Plate:
+
+    def __init__(self, readings:np.ndarray, excluded:np.ndarray|None = None):
+        '''Wraps a rows x columns array of well readings, rows are addressed by letter and columns by number starting at 1
+        as they are printed on the plate. Excluded wells are tracked in a boolean mask of the same shape'''
+        self.values = np.asarray(readings, dtype=np.float64)
+        if self.values.ndim != 2: raise ValueError("A plate must be a 2-D array of readings")
+        self.excluded = excluded if excluded is not None else np.zeros(self.values.shape, dtype=bool)
+
+    @property
+    def shape(self)->tuple[int, int]:
+        return self.values.shape
+
+    @property
+    def height(self)->int:
+        return self.values.shape[0]
+
+    @property
+    def width(self)->int:
+        return self.values.shape[1]
+
+    def __getitem__(self, key:str|tuple)->float|np.ndarray:
+        '''plate["A1"] returns the reading of a single well, any other key is passed on to the underlying array'''
+        if isinstance(key, str): return float(self.values[self.well_index(key)])
+        return self.values[key]
+
+    def __len__(self)->int:
+        return self.values.size
+
+    def row_index(self, letter:str)->int:
+        '''Converts a row letter, i.e "A" or "AF" on 1536 well plates, to a 0-based index'''
+        return row_index(letter)
+
+    def well_index(self, well:str)->tuple[int, int]:
+        '''Converts a well name such as "A1" or "P24" to a (row, column) index into the values array'''
+        return well_index(well)
+
+    def col(self, num:int)->np.ndarray:
+        '''Returns a view of the column, columns start at 1'''
+        return self.values[:, num-1]
+
+    def row(self, letter:str)->np.ndarray:
+        '''Returns a view of the row'''
+        return self.values[self.row_index(letter)]
+
+    def rows(self, span:str)->np.ndarray:
+        '''Returns a view of an inclusive span of rows, i.e "A:E"'''
+        first, last = span.split(":")
+        return self.values[self.row_index(first):self.row_index(last)+1]
+
+    def cols(self, span:str)->np.ndarray:
+        '''Returns a view of an inclusive span of columns, i.e "1:6"'''
+        first, last = span.split(":")
+        return self.values[:, int(first)-1:int(last)]
+
+    def halves(self)->tuple["Plate", "Plate"]:
+        '''Splits the plate into a left and a right half, both halves share memory with this plate'''
+        middle = self.width//2
+        return Plate(self.values[:, :middle], self.excluded[:, :middle]), Plate(self.values[:, middle:], self.excluded[:, middle:])
+
+    def exclude(self, *wells:str)->None:
+        '''Marks the wells as excluded, excluded wells are masked by gather and left out of the replicate statistics'''
+        for well in wells: self.excluded[self.well_index(well)] = True
+        return None
+
+    def masked(self)->np.ma.MaskedArray:
+        '''Returns the readings as a masked array that hides the excluded wells'''
+        return np.ma.MaskedArray(self.values, mask=self.excluded)
+
+    def gather(self, indices:np.ndarray)->np.ma.MaskedArray:
+        '''Takes the readings at the column-major well indices (A1=0, B1=1, ... A2=height), the result has the shape of
+        indices and masks the excluded wells, empty wells are NaN'''
+        cols, rows = np.divmod(np.asarray(indices), self.height)
+        return np.ma.MaskedArray(self.values[rows, cols], mask=self.excluded[rows, cols])
+
+    def replicates(self, stride:int = 2)->np.ma.MaskedArray:
+        '''Returns the whole plate as a samples x stride array, replicates sit in adjacent columns and excluded wells are masked'''
+        return np.ma.MaskedArray(replicate_blocks(self.values, stride), mask=replicate_blocks(self.excluded, stride).astype(bool))
+
+    def reduce(self, stride:int = 2, *reducers:str|np.ufunc|Callable)->np.ndarray|dict[str, np.ndarray]:
+        '''Reduces the replicates of every sample on the plate, see reduce_replicates'''
+        return reduce_replicates(self.replicates(stride), *reducers)
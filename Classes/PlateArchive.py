@@ -0,0 +1,177 @@
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.PlateCache import get_plate_cache, load_export
+from settings import *
+import functools
+import json
+import numpy as np
+import os
+import threading
+
+# Relative archive paths are resolved against the repository, not the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_FILE = 'index.jsonl'
+READINGS_EXT = '.f8'
+
+@dataclass
+class PlateRecord:
+    '''One archived plate block, slot is its position in the readings file of its assay and shape'''
+    run_id:str|None
+    archived:str
+    assay:str
+    cohort:str|None
+    source:str
+    digest:str
+    block:int
+    name:str
+    read_mode:str
+    wavelengths:tuple[int, ...]
+    layout:str|None
+    rows:int
+    cols:int
+    slot:int
+
+    @property
+    def file(self)->str:
+        return readings_file(self.assay, (self.rows, self.cols))
+
+@dataclass
+class PlateSelection:
+    '''The records of the selected plates and their readings stacked into a plates x rows x columns array'''
+    records:list[PlateRecord]
+    readings:np.ndarray
+
+    def __len__(self)->int:
+        return len(self.records)
+
+def readings_file(assay:str, shape:tuple[int, int])->str:
+    '''Every assay and plate shape has its own readings file, so the plates of one assay are contiguous in append order'''
+    return f"{assay}-{shape[0]}x{shape[1]}{READINGS_EXT}"
+
+def evenly_spaced(slots:np.ndarray)->slice|None:
+    '''Returns the slice selecting the slots if they are evenly spaced and increasing, None otherwise'''
+    if len(slots) == 0: return slice(0, 0)
+    if len(slots) == 1: return slice(int(slots[0]), int(slots[0])+1)
+    steps = np.diff(slots)
+    if steps[0] <= 0 or np.any(steps != steps[0]): return None
+    return slice(int(slots[0]), int(slots[-1])+1, int(steps[0]))
+
+class PlateArchive:
+
+    def __init__(self, archive_dir:str = PLATE_ARCHIVE_DIR):
+        '''Append-only archive of the raw readings of every processed plate. The readings of each assay and plate shape are
+        appended as float64 to one file that is memory-mapped as a plates x rows x columns array, the metadata of every plate
+        goes to an index with one json line per plate. Appends are written with O_APPEND and the index line only after the
+        readings, so several processes can archive at once and readers never see a plate without its readings. The index is
+        read incrementally and kept as numpy columns so selecting plates is a handful of vectorized comparisons'''
+        self.archive_dir = archive_dir if os.path.isabs(archive_dir) else os.path.join(REPO_DIR, archive_dir)
+        self.__lock = threading.Lock()
+        self.__records:list[PlateRecord] = []
+        self.__archived:set[tuple[str, str]] = set()
+        self.__index_offset = 0
+        self.__columns:dict[str, np.ndarray] = {}
+        self.__maps:dict[str, np.memmap] = {}
+
+    def add(self, export:SoftMaxExport, assay:str, run_id:str|None = None, cohort:str|None = None, layout:str|None = None, digest:str|None = None)->list[PlateRecord]:
+        '''Archives every plate block of the export and returns their records, an export whose digest is already archived for
+        the assay is skipped so re-analyzing a plate does not archive it twice'''
+        digest = digest or get_plate_cache().digest(export.filepath)
+        with self.__lock:
+            self.__refresh()
+            if (assay, digest) in self.__archived: return []
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archived = datetime.now().isoformat(timespec="seconds")
+            records = []
+            for index, block in enumerate(export.blocks):
+                readings = np.ascontiguousarray(block.readings, dtype=np.float64)
+                rows, cols = readings.shape
+                with open(os.path.join(self.archive_dir, readings_file(assay, (rows, cols))), "ab") as readings_out:
+                    readings_out.write(readings.tobytes())
+                    readings_out.flush()
+                    slot = readings_out.tell()//readings.nbytes - 1
+                records.append(PlateRecord(run_id, archived, assay, cohort, os.path.abspath(export.filepath), digest, index, block.header.name,
+                                           block.header.read_mode, tuple(block.header.wavelengths), layout, rows, cols, slot))
+            lines = "".join(json.dumps(asdict(record)) + "\n" for record in records)
+            with open(os.path.join(self.archive_dir, INDEX_FILE), "a", encoding="utf-8") as index_file: index_file.write(lines)
+        return records
+
+    def records(self)->list[PlateRecord]:
+        '''Returns the records of every archived plate in the order they were archived'''
+        with self.__lock:
+            self.__refresh()
+            return list(self.__records)
+
+    def select(self, assay:str|None = None, cohort:str|None = None, since:str|None = None, until:str|None = None, wavelength:int|None = None,
+               read_mode:str|None = None, layout:str|None = None, block:int|None = None, shape:tuple[int, int]|None = None)->PlateSelection:
+        '''Returns the plates matching every filter given, since and until are ISO dates compared against the time a plate was
+        archived (until is exclusive). The readings are a view of the memory-mapped file when the plates sit at evenly spaced
+        slots of one file, which is the case for any date range of one assay and block, otherwise only the selected plates
+        are copied. All the selected plates must have the same shape'''
+        with self.__lock:
+            self.__refresh()
+            if not self.__records: return PlateSelection([], np.empty((0, *(shape or PLATE_FORMATS[96])), dtype=np.float64))
+            columns = self.__columns
+            mask = np.ones(len(self.__records), dtype=bool)
+            for column, value in (("assay", assay), ("cohort", cohort), ("read_mode", read_mode), ("layout", layout), ("block", block)):
+                if value is not None: mask &= columns[column] == value
+            if since is not None: mask &= columns["archived"] >= since
+            if until is not None: mask &= columns["archived"] < until
+            if shape is not None: mask &= (columns["rows"] == shape[0]) & (columns["cols"] == shape[1])
+            if wavelength is not None: mask &= np.array([wavelength in record.wavelengths for record in self.__records], dtype=bool)
+            by_file:dict[str, list[PlateRecord]] = {}
+            for index in np.flatnonzero(mask): by_file.setdefault(self.__records[index].file, []).append(self.__records[index])
+            shapes = {(records[0].rows, records[0].cols) for records in by_file.values()}
+            if len(shapes) > 1: raise ValueError(f"The selected plates have different shapes {sorted(shapes)}, select one shape")
+            if not by_file: return PlateSelection([], np.empty((0, *(shape or PLATE_FORMATS[96])), dtype=np.float64))
+            stacks = []
+            for file, records in by_file.items():
+                slots = np.array([record.slot for record in records])
+                readings = self.__map(file, records[0].rows, records[0].cols, int(slots.max()))
+                spaced = evenly_spaced(slots)
+                stacks.append(readings[spaced] if spaced is not None else readings[slots])
+        # The plates of every file are kept together so the records are in the order of the stacked readings
+        return PlateSelection([record for records in by_file.values() for record in records], stacks[0] if len(stacks) == 1 else np.concatenate(stacks))
+
+    def readings(self, record:PlateRecord)->np.ndarray:
+        '''Returns the readings of one archived plate as a read-only view of the memory-mapped file'''
+        with self.__lock: return self.__map(record.file, record.rows, record.cols, record.slot)[record.slot]
+
+    def __map(self, file:str, rows:int, cols:int, slot:int)->np.memmap:
+        '''Returns the readings file as a plates x rows x columns memmap, mapped again once it has grown past the slot'''
+        mapped = self.__maps.get(file)
+        if mapped is None or mapped.shape[0] <= slot:
+            path = os.path.join(self.archive_dir, file)
+            plates = os.path.getsize(path)//(rows*cols*8)
+            mapped = self.__maps[file] = np.memmap(path, dtype=np.float64, mode="r", shape=(plates, rows, cols))
+        return mapped
+
+    def __refresh(self)->None:
+        '''Reads the index lines appended since the last call, a line still being written is left for the next call'''
+        index = os.path.join(self.archive_dir, INDEX_FILE)
+        if not os.path.exists(index) or os.path.getsize(index) == self.__index_offset: return None
+        with open(index, "rb") as index_file:
+            index_file.seek(self.__index_offset)
+            appended = index_file.read()
+        complete = appended.rfind(b"\n") + 1
+        for line in appended[:complete].splitlines():
+            if not line.strip(): continue
+            fields = json.loads(line)
+            self.__records.append(PlateRecord(**{**fields, "wavelengths":tuple(fields["wavelengths"])}))
+            self.__archived.add((fields["assay"], fields["digest"]))
+        self.__index_offset += complete
+        self.__columns = {
+            column:np.array([getattr(record, column) for record in self.__records], dtype=object if column in ("cohort", "layout") else None)
+            for column in ("archived", "assay", "cohort", "read_mode", "layout", "block", "rows", "cols")
+        }
+        return None
+
+@functools.lru_cache(maxsize=None)
+def get_plate_archive(archive_dir:str = PLATE_ARCHIVE_DIR)->PlateArchive:
+    '''Returns the one PlateArchive of the archive folder in this process'''
+    return PlateArchive(archive_dir)
+
+def archive_export(filepath:str, assay:str, run_id:str|None = None, cohort:str|None = None, layout:str|None = None, export:SoftMaxExport|None = None)->list[PlateRecord]:
+    '''Archives the plates of a processed text export, nothing is archived if PLATE_ARCHIVE_DIR is None'''
+    if not PLATE_ARCHIVE_DIR: return []
+    return get_plate_archive().add(export or load_export(filepath), assay, run_id, cohort, layout)
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from dataclasses import asdict
+from Classes.SoftMaxExport import SoftMaxExport, PlateBlock, PlateHeader
+from settings import *
+import functools
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import threading
+import uuid
+
+# Relative cache paths are resolved against the repository, not the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+META_FILE = 'export.json'
+# Bumped when the parsing of the exports changes, entries stored by an older parser are parsed again
+CACHE_VERSION = 2
+# Number of exports also kept in memory so re-analyzing one in the same session does not even touch the disk
+MEMORY_ENTRIES = 16
+# Number of files whose content hash is remembered, a long running watcher sees every export the plate reader ever wrote
+DIGEST_ENTRIES = 1024
+
+class PlateCache:
+
+    def __init__(self, cache_dir:str = PLATE_CACHE_DIR, max_bytes:int = PLATE_CACHE_BYTES):
+        '''Keeps parsed SoftMax Pro exports on disk keyed by a hash of the bytes of the text file, so an export is only decoded
+        once however often it is renamed, copied or re-analyzed. Every entry is a folder with the rows and headers in a json file
+        and the readings of each block in a .npy file that is memory-mapped when loaded. The least recently used entries are
+        removed once the cache grows past max_bytes. The last MEMORY_ENTRIES exports are also kept in memory, their rows and
+        read-only readings are shared by every export handed out'''
+        self.cache_dir = cache_dir if os.path.isabs(cache_dir) else os.path.join(REPO_DIR, cache_dir)
+        self.max_bytes = max_bytes
+        self.__digests:OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__recent:OrderedDict[str, SoftMaxExport] = OrderedDict()
+
+    def digest(self, filepath:str)->str:
+        '''Returns the content hash of the file, remembered for as long as its size and modification time do not change. Only
+        the last hash of the DIGEST_ENTRIES most recently used files is kept, the file is hashed outside the lock'''
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        with self.__lock:
+            known = self.__digests.get(path)
+            if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                self.__digests.move_to_end(path)
+                return known[2]
+        with open(filepath, "rb") as raw_file: digest = hashlib.blake2b(raw_file.read(), digest_size=16).hexdigest()
+        with self.__lock:
+            self.__digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            self.__digests.move_to_end(path)
+            while len(self.__digests) > DIGEST_ENTRIES: self.__digests.popitem(last=False)
+        return digest
+
+    def load(self, filepath:str)->SoftMaxExport:
+        '''Returns the export from the cache, parsing and storing it first if it is not cached. Exports the plate reader is still
+        writing are parsed but not stored'''
+        digest = self.digest(filepath)
+        with self.__lock:
+            if digest in self.__recent:
+                self.__recent.move_to_end(digest)
+                cached = self.__recent[digest]
+                return SoftMaxExport.from_parts(filepath, cached.rows, cached.blocks, cached.complete)
+        entry = os.path.join(self.cache_dir, digest)
+        export = self.__read(entry, filepath)
+        if export is None:
+            export = SoftMaxExport(filepath)
+            if not export.complete: return export
+            for block in export.blocks: block.readings.flags.writeable = False
+            self.__store(entry, export)
+        with self.__lock:
+            self.__recent[digest] = export
+            while len(self.__recent) > MEMORY_ENTRIES: self.__recent.popitem(last=False)
+        return export
+
+    def __read(self, entry:str, filepath:str)->SoftMaxExport|None:
+        '''Returns the cached export or None if the entry is missing, a damaged entry or one of an older CACHE_VERSION is removed'''
+        if not os.path.isdir(entry): return None
+        try:
+            with open(os.path.join(entry, META_FILE), "r", encoding="utf-8") as meta_file: meta = json.load(meta_file)
+            if meta.get("version") != CACHE_VERSION: raise ValueError(f"{entry} was stored by an older parser")
+            blocks = []
+            for index, header in enumerate(meta["headers"]):
+                readings = np.load(os.path.join(entry, f"readings{index}.npy"), mmap_mode="r")
+                blocks.append(PlateBlock(PlateHeader(**{**header, "wavelengths":tuple(header["wavelengths"])}), readings))
+        except (OSError, ValueError, KeyError, TypeError):
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(entry)
+        return SoftMaxExport.from_parts(filepath, meta["rows"], blocks, meta["complete"])
+
+    def __store(self, entry:str, export:SoftMaxExport)->None:
+        '''Writes the entry to a temporary folder that is renamed into place, so readers never see half an entry'''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = f"{entry}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(staging)
+        try:
+            meta = {"version":CACHE_VERSION, "rows":export.rows, "complete":export.complete, "headers":[asdict(block.header) for block in export.blocks]}
+            with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as meta_file: json.dump(meta, meta_file)
+            for index, block in enumerate(export.blocks): np.save(os.path.join(staging, f"readings{index}.npy"), block.readings)
+            os.rename(staging, entry)
+        except OSError:
+            # Another thread or process stored the same export first
+            shutil.rmtree(staging, ignore_errors=True)
+            return None
+        self.evict()
+        return None
+
+    def entries(self)->list[tuple[str, float, int]]:
+        '''Returns (folder, last use, bytes) of every entry, least recently used first'''
+        entries = []
+        with os.scandir(self.cache_dir) as folders:
+            for folder in folders:
+                if not folder.is_dir() or folder.name.endswith(".tmp"): continue
+                with os.scandir(folder.path) as files: size = sum(file.stat().st_size for file in files)
+                entries.append((folder.path, folder.stat().st_mtime, size))
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def evict(self)->None:
+        '''Removes the least recently used entries until the cache fits in max_bytes'''
+        with self.__lock:
+            entries = self.entries()
+            total = sum(size for _, _, size in entries)
+            for folder, _, size in entries:
+                if total <= self.max_bytes: break
+                # An entry that is still memory-mapped cannot be removed on Windows, it is left for the next eviction
+                shutil.rmtree(folder, ignore_errors=True)
+                total -= size
+        return None
+
+    def clear(self)->None:
+        with self.__lock:
+            self.__recent.clear()
+            self.__digests.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        return None
+
+@functools.lru_cache(maxsize=None)
+def get_plate_cache(cache_dir:str = PLATE_CACHE_DIR)->PlateCache:
+    '''Returns the one PlateCache of the cache folder in this process'''
+    return PlateCache(cache_dir)
+
+def load_export(filepath:str)->SoftMaxExport:
+    '''Parses a text export through the PlateCache, the cache is skipped if PLATE_CACHE_DIR is None'''
+    if not PLATE_CACHE_DIR: return SoftMaxExport(filepath)
+    return get_plate_cache().load(filepath)
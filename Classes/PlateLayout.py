@@ -0,0 +1,158 @@
+from dataclasses import dataclass
+from Classes.Plate import Plate, ROW_LETTERS, well_index
+from settings import *
+import numpy as np
+import functools
+import json
+
+@dataclass
+class CompiledLayout:
+    '''Integer gather map of a layout for one plate shape and set of group sizes. Row n of indices holds the column-major
+    well index of every replicate of one sample, groups with fewer replicates than the widest group are padded with -1'''
+    indices:np.ndarray
+    groups:dict[str, slice]
+    replicates:dict[str, int]
+    height:int
+
+    def gather(self, plate:Plate)->np.ma.MaskedArray:
+        '''Takes every well of every group from the plate in a single gather, padded and excluded wells are masked'''
+        padding = self.indices < 0
+        values = plate.gather(np.where(padding, 0, self.indices))
+        values[padding] = np.ma.masked
+        return values
+
+    def split(self, values:np.ndarray)->dict[str, np.ndarray]:
+        '''Splits gathered (or reduced) values back into views per group'''
+        if values.ndim == 1: return {name:values[rows] for name, rows in self.groups.items()}
+        return {name:values[rows, :self.replicates[name]] for name, rows in self.groups.items()}
+
+    def unread(self, reduced:np.ndarray, labels:dict[str, list]|None = None)->list[str]:
+        '''Returns "label (wells)" for every sample whose reduced value is NaN, i.e one of its wells is empty in the export or
+        all of them are excluded. The samples are named by their labels, or by their group and number for the groups without labels'''
+        labels = labels if labels else {}
+        unread = []
+        for name, rows in self.groups.items():
+            for number, row in enumerate(range(rows.start, rows.stop)):
+                if not np.isnan(reduced[row]): continue
+                cols, well_rows = np.divmod(self.indices[row, :self.replicates[name]], self.height)
+                wells = ", ".join(f"{ROW_LETTERS[well_row]}{col+1}" for well_row, col in zip(well_rows.tolist(), cols.tolist()))
+                label = labels[name][number] if name in labels else f"{name} {number+1}"
+                unread.append(f"{label} ({wells})")
+        return unread
+
+class PlateLayout:
+
+    def __init__(self, description:dict):
+        '''A declarative description of where each group of samples sits on a plate. description["groups"] is an ordered
+        list of groups, each with a "name", a number of "replicates" (1 by default) and one of the placements:
+            - "wells": well ranges filled in column-major order, i.e ["A5:H5", "A6:E6"]
+            - "columns": the first column of each block of samples, the replicates sit in the following columns
+            - "start": the first well, samples fill each column and then skip over the columns holding their replicates
+            - "follows": name of an earlier "start"/"follows" group that this group is packed after
+        '''
+        self.name = description.get("name", "")
+        self.plate_format = description.get("plate_format")
+        self.groups = description["groups"]
+        self.__compiled = {}
+
+        for group in self.groups:
+            placements = [key for key in ("wells", "columns", "start", "follows") if key in group]
+            if len(placements) != 1: raise ValueError(f"Group '{group.get('name')}' needs exactly one of wells, columns, start or follows")
+
+    @classmethod
+    def from_file(cls, filepath:str)->"PlateLayout":
+        '''Loads a layout description from a json file'''
+        with open(filepath, "r") as layout_file: return cls(json.load(layout_file))
+
+    @classmethod
+    def from_settings(cls, replicates:int = 2, sample_col:int|None = None, control_col:int|None = None)->"PlateLayout":
+        '''Builds the layout used by the ELISA plates, samples start in the SAMPLE_COLUMNS and controls in the CONTROL_COLUMNS.
+        Given a start column for the samples or the controls, the samples fill every block of replicates from sample_col up to
+        control_col and the controls every block from control_col up to the DEFAULT_LAST_COLUMN'''
+        if sample_col is None and control_col is None: sample_columns, control_columns, name = SAMPLE_COLUMNS, CONTROL_COLUMNS, "settings"
+        else:
+            sample_col = int(sample_col) if sample_col is not None else int(SAMPLE_COLUMNS[0])
+            control_col = int(control_col) if control_col is not None else int(CONTROL_COLUMNS[0])
+            if not 1 <= sample_col <= control_col - replicates <= DEFAULT_LAST_COLUMN - 2*replicates + 1:
+                raise ValueError(f"Samples starting in column {sample_col} and controls in column {control_col} do not fit on the plate, "
+                                 f"expected 1 <= samples <= controls - {replicates} <= {DEFAULT_LAST_COLUMN - 2*replicates + 1}")
+            sample_columns = [str(col) for col in range(sample_col, control_col - replicates + 1, replicates)]
+            control_columns = [str(col) for col in range(control_col, DEFAULT_LAST_COLUMN - replicates + 2, replicates)]
+            same = sample_columns == SAMPLE_COLUMNS and control_columns == CONTROL_COLUMNS
+            name = "settings" if same else f"columns {sample_col}/{control_col}"
+        return cls({
+            "name":name,
+            "groups":[
+                {"name":"samples", "replicates":replicates, "columns":sample_columns},
+                {"name":"controls", "replicates":replicates, "columns":control_columns},
+            ]
+        })
+
+    def compile(self, shape:tuple[int, int], sizes:dict[str, int]|None = None)->CompiledLayout:
+        '''Compiles the layout into a CompiledLayout for a plate shape, sizes gives the number of samples in each group that
+        is not placed with "wells". The result is cached so it is only computed once per shape and sizes'''
+        sizes = sizes if sizes else {}
+        key = (tuple(shape), tuple(sorted(sizes.items())))
+        if key not in self.__compiled: self.__compiled[key] = self.__compile(shape, sizes)
+        return self.__compiled[key]
+
+    def __compile(self, shape:tuple[int, int], sizes:dict[str, int])->CompiledLayout:
+        height, width = shape
+        if self.plate_format and self.plate_format != height*width:
+            raise ValueError(f"Layout '{self.name}' is for {self.plate_format} well plates, not {height*width}")
+
+        blocks = []
+        starts = {}
+        for group in self.groups:
+            name = group["name"]
+            replicates = group.get("replicates", 1)
+            if "wells" in group:
+                wells = np.concatenate([expand_range(well_range, height) for well_range in group["wells"]])
+                indices = wells[:, None] + height*np.arange(replicates)
+            elif "columns" in group:
+                index = np.arange(sizes.get(name, 0))
+                block, row = np.divmod(index, height)
+                if block.size and block.max() >= len(group["columns"]):
+                    raise ValueError(f"{index.size} samples do not fit in the columns of group '{name}'")
+                first_col = np.array([int(col)-1 for col in group["columns"]])
+                indices = (first_col[block]*height + row)[:, None] + height*np.arange(replicates)
+            else:
+                if "start" in group:
+                    start = expand_range(group["start"], height)[0]
+                else:
+                    if group["follows"] not in starts: raise ValueError(f"Group '{name}' can only follow an earlier start or follows group")
+                    previous_start, previous_size, previous_replicates = starts[group["follows"]]
+                    start = previous_start + previous_size*previous_replicates
+                index = np.arange(sizes.get(name, 0))
+                first = start + index + height*(index//height)*(replicates-1)
+                indices = first[:, None] + height*np.arange(replicates)
+                starts[name] = (start, index.size, replicates)
+            if indices.size and indices.max() >= height*width:
+                raise ValueError(f"Group '{name}' does not fit on a {height*width} well plate")
+            blocks.append((name, replicates, indices))
+
+        max_replicates = max(replicates for _, replicates, _ in blocks)
+        total = sum(len(indices) for _, _, indices in blocks)
+        stacked = np.full((total, max_replicates), -1, dtype=np.intp)
+        groups = {}
+        row = 0
+        for name, replicates, indices in blocks:
+            stacked[row:row+len(indices), :replicates] = indices
+            groups[name] = slice(row, row+len(indices))
+            row += len(indices)
+
+        return CompiledLayout(stacked, groups, {name:replicates for name, replicates, _ in blocks}, height)
+
+def expand_range(well_range:str, height:int)->np.ndarray:
+    '''Expands a well or an inclusive range of wells, i.e "A1" or "A5:H6", into column-major well indices'''
+    first, _, last = well_range.partition(":")
+    first_row, first_col = well_index(first)
+    last_row, last_col = well_index(last) if last else (first_row, first_col)
+    rows = np.arange(first_row, last_row+1)
+    cols = np.arange(first_col, last_col+1)
+    return (cols[:, None]*height + rows).ravel()
+
+@functools.lru_cache
+def load_layout(filepath:str)->PlateLayout:
+    '''Loads a layout file once per process'''
+    return PlateLayout.from_file(filepath)
@@ -0,0 +1,17 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt
+import os
+
+# Open previews are kept here so they are not garbage collected while they are shown
+_open_previews:list["PlotPreview"] = []
+
+class PlotPreview(QLabel):
+    def __init__(self, image:str):
+        '''Window showing a rendered standard curve, it does not block and any number of them can be open'''
+        super().__init__()
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle(os.path.basename(image))
+        self.setPixmap(QPixmap(image))
+        _open_previews.append(self)
+        self.destroyed.connect(lambda: _open_previews.remove(self) if self in _open_previews else None)
@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Iterator
+from settings import *
+import cProfile
+import fnmatch
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+
+# Relative log paths are resolved against the repository, not the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+
+def _resolve(path:str)->str:
+    return path if os.path.isabs(path) else os.path.join(REPO_DIR, path)
+
+class RunRecorder:
+
+    def __init__(self, pipeline:str, log_file:str|None = RUN_LOG, profile_stage:str|None = None, trace_memory:bool|None = None):
+        '''Records the wall time, CPU time of the thread and tracemalloc peak above the memory in use at its start of every stage of one run of a pipeline and appends
+        one json line per run to log_file. Stages whose name matches profile_stage (fnmatch, PROFILE_STAGE environment variable by
+        default) are also run under cProfile and dumped to PROFILE_DIR. tracemalloc slows the pipelines down several times so the
+        peaks are only recorded with trace_memory (TRACE_MEMORY environment variable set to 1 by default, then TRACE_MEMORY), the
+        peak_kib of the stages is None otherwise. tracemalloc sees the whole process so the peaks include whatever other threads
+        allocated at the same time'''
+        self.pipeline = pipeline
+        self.log_file = log_file
+        self.profile_stage = profile_stage if profile_stage is not None else os.environ.get("PROFILE_STAGE", PROFILE_STAGE)
+        self.trace_memory = trace_memory if trace_memory is not None else os.environ.get("TRACE_MEMORY", str(int(TRACE_MEMORY))) == "1"
+        self.run_id = uuid.uuid4().hex[:12]
+        self.record:dict[str, Any] = {"run_id":self.run_id, "pipeline":pipeline, "started":None, "status":"ok", "error":None, "stages":[]}
+        self.__open:list[dict[str, Any]] = []
+        self.__run:dict[str, Any]|None = None
+
+    def __enter__(self)->"RunRecorder":
+        global _tracing_runs
+        if self.trace_memory:
+            with _tracing_lock:
+                if _tracing_runs == 0 and not tracemalloc.is_tracing(): tracemalloc.start()
+                _tracing_runs += 1
+        self.__parent = getattr(_local, "recorder", None)
+        _local.recorder = self
+        self.record["started"] = datetime.now().isoformat(timespec="seconds")
+        self.__run = self.__start(None)
+        return self
+
+    def __exit__(self, error_type:type|None, error:BaseException|None, traceback:Any)->None:
+        global _tracing_runs
+        while self.__open: self.__stop(self.__open[-1])
+        self.__stop(self.__run)
+        if error is not None:
+            self.record["status"] = "cancelled" if error_type.__name__ == "JobCancelled" else "error"
+            self.record["error"] = f"{error_type.__name__}: {error}" if str(error) else error_type.__name__
+        self.record.update({key:self.__run[key] for key in ("wall_s", "cpu_s", "peak_kib")})
+        _local.recorder = self.__parent
+        if self.trace_memory:
+            with _tracing_lock:
+                _tracing_runs -= 1
+                if _tracing_runs == 0: tracemalloc.stop()
+        self.write()
+        return None
+
+    def __start(self, name:str|None)->dict[str, Any]:
+        '''Opens a stage, the peak so far is folded into every open stage before tracemalloc's peak is reset for the new one'''
+        self.__fold_peak()
+        if tracemalloc.is_tracing(): tracemalloc.reset_peak()
+        start_kib = tracemalloc.get_traced_memory()[0]/1024 if tracemalloc.is_tracing() else None
+        stage = {"stage":name, "wall_s":time.perf_counter(), "cpu_s":time.thread_time(), "peak_kib":start_kib, "start_kib":start_kib}
+        profiling = any("profiler" in open_stage for open_stage in self.__open)
+        if name is not None and self.profile_stage and not profiling and fnmatch.fnmatch(name, self.profile_stage):
+            stage["profiler"] = cProfile.Profile()
+            stage["profiler"].enable()
+        return stage
+
+    def __stop(self, stage:dict[str, Any])->None:
+        if "profiler" in stage:
+            profiler = stage.pop("profiler")
+            profiler.disable()
+            stage["profile"] = os.path.join(_resolve(PROFILE_DIR), f"{self.run_id}-{stage['stage'].replace('/', '_').replace(' ', '_')}.prof")
+            os.makedirs(os.path.dirname(stage["profile"]), exist_ok=True)
+            profiler.dump_stats(stage["profile"])
+        self.__fold_peak()
+        stage["wall_s"] = round(time.perf_counter() - stage["wall_s"], 6)
+        stage["cpu_s"] = round(time.thread_time() - stage["cpu_s"], 6)
+        start_kib = stage.pop("start_kib")
+        stage["peak_kib"] = round(stage["peak_kib"] - start_kib, 1) if start_kib is not None else None
+        self.__open = [open_stage for open_stage in self.__open if open_stage is not stage]
+        return None
+
+    def __fold_peak(self)->None:
+        if not tracemalloc.is_tracing(): return None
+        peak = tracemalloc.get_traced_memory()[1]/1024
+        for stage in self.__open + ([self.__run] if self.__run else []):
+            # Stages opened before another run started tracemalloc have no starting point to measure from
+            if stage["start_kib"] is not None: stage["peak_kib"] = max(stage["peak_kib"], peak)
+        return None
+
+    @contextmanager
+    def stage(self, name:str)->Iterator[dict[str, Any]]:
+        '''Records the block as a stage, a stage opened inside another is named parent/child'''
+        path = "/".join([stage["stage"] for stage in self.__open] + [name])
+        stage = self.__start(path)
+        self.record["stages"].append(stage)
+        self.__open.append(stage)
+        try:
+            yield stage
+        finally:
+            self.__stop(stage)
+
+    def progress(self, callback:Callable[[str, int, int], None]|None = None)->Callable[[str, int, int], None]:
+        '''Returns a progress callback for the pipeline that ends the previous stage and starts the named one before passing the
+        call on to callback, so the stages the pipelines already report are recorded without touching them'''
+        def report(name:str, step:int, steps:int)->None:
+            while self.__open: self.__stop(self.__open[-1])
+            if callback: callback(name, step, steps)
+            stage = self.__start(name)
+            self.record["stages"].append(stage)
+            self.__open.append(stage)
+            return None
+        return report
+
+    def note(self, **values:Any)->None:
+        '''Adds the values to the innermost open stage, or to the run if no stage is open'''
+        (self.__open[-1] if self.__open else self.record).update(values)
+        return None
+
+    def write(self)->None:
+        '''Appends the record of the run to the log file as one json line'''
+        if not self.log_file: return None
+        log_file = _resolve(self.log_file)
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        line = json.dumps(self.record, default=str) + "\n"
+        with _write_lock, open(log_file, "a", encoding="utf-8") as log: log.write(line)
+        return None
+
+def current()->RunRecorder|None:
+    '''Returns the recorder of the run on the calling thread'''
+    return getattr(_local, "recorder", None)
+
+def current_run_id()->str:
+    '''Returns the id of the run on the calling thread so anything saved for it can be matched with its log, outside of a
+    recorded run a new id is returned'''
+    recorder = current()
+    return recorder.run_id if recorder else uuid.uuid4().hex[:12]
+
+@contextmanager
+def stage(name:str)->Iterator[None]:
+    '''Records the block as a stage of the run on the calling thread, does nothing outside of a recorded run'''
+    recorder = current()
+    if recorder is None:
+        yield None
+        return
+    with recorder.stage(name): yield None
+
+def note(**values:Any)->None:
+    '''Adds the values to the open stage of the run on the calling thread, does nothing outside of a recorded run'''
+    recorder = current()
+    if recorder is not None: recorder.note(**values)
+    return None
+
+def instrumented(pipeline:str)->Callable[[Callable], Callable]:
+    '''Decorates the main function of a pipeline so every call is recorded by a RunRecorder, the progress stages it reports
+    become the stages of the run and its first argument is logged as the input. Nothing is recorded if RUN_LOG is None'''
+    def decorator(function:Callable)->Callable:
+        @functools.wraps(function)
+        def wrapper(*args:Any, progress:Callable[[str, int, int], None]|None = None, **kwargs:Any)->Any:
+            if not RUN_LOG or current() is not None: return function(*args, progress=progress, **kwargs)
+            with RunRecorder(pipeline) as recorder:
+                if args and isinstance(args[0], str): recorder.record["input"] = args[0]
+                return function(*args, progress=recorder.progress(progress), **kwargs)
+        return wrapper
+    return decorator
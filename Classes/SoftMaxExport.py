@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field
+from Classes.Plate import ROW_LETTERS
+from settings import *
+import numpy as np
+
+# Positions of the header fields within the "Plate:" line of a SoftMax Pro plate format export
+NAME_FIELD = 1
+READ_TYPE_FIELD = 4
+READ_MODE_FIELD = 5
+DATA_MODE_FIELD = 6
+WAVELENGTHS_FIELD = 15
+FIRST_DATA_FIELD = 2
+
+@dataclass
+class PlateHeader:
+    name:str
+    read_type:str
+    read_mode:str
+    data_mode:str
+    wavelengths:tuple[int, ...]
+    plate_format:int
+    fields:list[str] = field(default_factory=list)
+
+@dataclass
+class PlateBlock:
+    header:PlateHeader
+    readings:np.ndarray
+
+class SoftMaxExport:
+
+    def __init__(self, filepath:str):
+        '''Decodes a utf-16 SoftMax Pro text export once, keeping the tab separated rows and every plate block
+        found between a "Plate:" header and its "~End" terminator'''
+        with open(filepath, "r", encoding=FILE_ENCODING) as raw_file: lines = raw_file.read().splitlines()
+        self.filepath = filepath
+        self.rows = [line.split(FILE_DELIMITER) for line in lines[1:] if line]
+        self.complete = True
+        self.blocks = self.__find_blocks(self.rows)
+        if not self.blocks: raise ValueError(f"No '{PLATE_HEADER}' block found in {filepath}")
+        expected_blocks = lines[0].partition("=")[2].strip() if lines else ""
+        if expected_blocks.isdigit() and int(expected_blocks) != len(self.blocks): self.complete = False
+
+    @classmethod
+    def from_parts(cls, filepath:str, rows:list[list[str]], blocks:list[PlateBlock], complete:bool = True)->"SoftMaxExport":
+        '''Rebuilds an export that was already parsed, i.e from the PlateCache, without reading the text file'''
+        export = cls.__new__(cls)
+        export.filepath = filepath
+        export.rows = rows
+        export.blocks = blocks
+        export.complete = complete
+        return export
+
+    def __find_blocks(self, rows:list[list[str]])->list[PlateBlock]:
+        '''Returns a PlateBlock for every "Plate:" header, the row after the header holds the column numbers and
+        every row until the "~End" terminator holds the readings, a missing terminator marks the export as incomplete'''
+        blocks = []
+        index = 0
+        while index < len(rows):
+            if rows[index][0] != PLATE_HEADER:
+                index += 1
+                continue
+            header_fields = rows[index]
+            if index+1 == len(rows):
+                self.complete = False
+                break
+            width = len([num for num in rows[index+1][FIRST_DATA_FIELD:] if num.strip()])
+            end = index+2
+            while end < len(rows) and rows[end][0] != PLATE_TERMINATOR: end += 1
+            if end == len(rows): self.complete = False
+            readings = self.__to_array(rows[index+2:end], width, header_fields[NAME_FIELD].strip() if len(header_fields) > NAME_FIELD else "")
+            blocks.append(PlateBlock(self.__parse_header(header_fields, readings), readings))
+            index = end+1
+        return blocks
+
+    def __to_array(self, rows:list[list[str]], width:int, name:str)->np.ndarray:
+        '''Converts the reading rows into a float64 array, empty wells become NaN. A well that is not a number, i.e "#SAT" or
+        "Range?" when the reading is out of the range of the reader, raises a ValueError naming the well so the plate is never
+        analyzed without it'''
+        readings = np.full((len(rows), width), np.nan, dtype=np.float64)
+        for row_index, row in enumerate(rows):
+            for col_index, val in enumerate(row[FIRST_DATA_FIELD:FIRST_DATA_FIELD+width]):
+                if not val.strip(): continue
+                try:
+                    readings[row_index, col_index] = float(val)
+                except ValueError:
+                    raise ValueError(f"Well {ROW_LETTERS[row_index]}{col_index+1} of plate '{name}' in {self.filepath} reads {val.strip()!r}, not a number") from None
+        return readings
+
+    def __parse_header(self, fields:list[str], readings:np.ndarray)->PlateHeader:
+        '''Parses the "Plate:" row into a PlateHeader, the plate format is taken from the shape of the readings'''
+        get = lambda index: fields[index].strip() if index < len(fields) else ""
+        read_mode = get(READ_MODE_FIELD)
+        wavelengths = tuple(int(wl) for wl in get(WAVELENGTHS_FIELD).split() if wl.isdigit()) if read_mode == "Absorbance" else ()
+        plate_format = next((wells for wells, shape in PLATE_FORMATS.items() if shape == readings.shape), readings.size)
+        return PlateHeader(get(NAME_FIELD), get(READ_TYPE_FIELD), read_mode, get(DATA_MODE_FIELD), wavelengths, plate_format, fields)
+
+    def readings(self, block:int = 0)->np.ndarray:
+        '''Returns the rows x columns float64 readings of the plate block'''
+        return self.blocks[block].readings
+
+    def header(self, block:int = 0)->PlateHeader:
+        '''Returns the header metadata of the plate block'''
+        return self.blocks[block].header
@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+import numpy as np
+
+MODELS = ("linear", "log-linear", "4PL", "5PL")
+# Codes returned by StandardCurve.flags
+IN_RANGE = 0
+BELOW_LLOQ = -1
+ABOVE_ULOQ = 1
+NOT_QUANTIFIABLE = 2
+
+def _logistic(model:str, x:np.ndarray, params:np.ndarray)->tuple[np.ndarray, np.ndarray]:
+    '''Returns the 4PL/5PL response and its plates x points x parameters jacobian. The parameters are (a, b, ln c, d) and
+    (a, b, ln c, d, ln g), a is the response at zero concentration, d at infinite concentration, c the inflection point,
+    b the slope and g the asymmetry. c and g are fitted as logarithms so they stay positive'''
+    a, b, log_c, d = [params[:, [index]] for index in range(4)]
+    g = np.exp(np.clip(params[:, [4]], -10, 10)) if model == "5PL" else np.ones_like(a)
+    log_ratio = np.log(x) - log_c
+    u = np.exp(np.clip(b*log_ratio, -700, 700))
+    s = 1 + u
+    s_g = s**-g
+    response = d + (a-d)*s_g
+    d_u = -(a-d)*g*s_g/s
+    columns = [s_g, d_u*u*log_ratio, -d_u*u*b, 1-s_g]
+    if model == "5PL": columns.append(-(a-d)*s_g*np.log(s)*g)
+    return response, np.stack(columns, axis=-1)
+
+def _initial_guess(model:str, x:np.ndarray, y:np.ndarray, weights:np.ndarray)->np.ndarray:
+    '''Starts the asymptotes at the responses of the lowest and highest standard and the inflection point at the middle of
+    the concentrations on a log scale'''
+    order = np.argsort(np.where(weights > 0, x, np.inf), axis=1)
+    last = (weights > 0).sum(axis=1) - 1
+    rows = np.arange(len(x))
+    a = y[rows, order[:, 0]]
+    d = y[rows, order[rows, np.maximum(last, 0)]]
+    log_c = np.nansum(np.log(x)*weights, axis=1)/np.maximum(weights.sum(axis=1), 1)
+    guess = [a, np.ones(len(x)), log_c, d] + ([np.zeros(len(x))] if model == "5PL" else [])
+    return np.stack(guess, axis=1)
+
+def levenberg_marquardt(model:str, x:np.ndarray, y:np.ndarray, weights:np.ndarray, max_iterations:int = 200, tolerance:float = 1e-10)->tuple[np.ndarray, np.ndarray]:
+    '''Fits the 4PL or 5PL model to every plate at once, every plate keeps its own damping factor and stops once its step
+    no longer changes the sum of squares. Returns the parameters and whether each plate converged'''
+    params = _initial_guess(model, x, y, weights)
+    with np.errstate(all="ignore"): return _levenberg_marquardt(model, x, y, weights, params, max_iterations, tolerance)
+
+def _levenberg_marquardt(model:str, x:np.ndarray, y:np.ndarray, weights:np.ndarray, params:np.ndarray, max_iterations:int, tolerance:float)->tuple[np.ndarray, np.ndarray]:
+    damping = np.full(len(x), 1e-3)
+    converged = np.zeros(len(x), dtype=bool)
+    response, jacobian = _logistic(model, x, params)
+    residuals = (y-response)*weights
+    cost = (residuals**2).sum(axis=1)
+    for _ in range(max_iterations):
+        weighted_jacobian = jacobian*weights[..., None]
+        jtj = weighted_jacobian.transpose(0, 2, 1) @ weighted_jacobian
+        jtr = (weighted_jacobian.transpose(0, 2, 1) @ residuals[..., None])[..., 0]
+        diagonal = np.einsum("pii->pi", jtj)
+        damped = jtj + (damping[:, None]*np.maximum(diagonal, 1e-12))[:, :, None]*np.eye(params.shape[1])
+        try:
+            step = np.linalg.solve(damped, jtr[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = (np.linalg.pinv(damped) @ jtr[..., None])[..., 0]
+        trial = np.where(converged[:, None], params, params+step)
+        trial_response, trial_jacobian = _logistic(model, x, trial)
+        trial_residuals = (y-trial_response)*weights
+        trial_cost = (trial_residuals**2).sum(axis=1)
+        better = np.isfinite(trial_cost) & (trial_cost <= cost) & ~converged
+        converged |= better & (cost-trial_cost <= tolerance*np.maximum(cost, 1e-30))
+        params = np.where(better[:, None], trial, params)
+        response = np.where(better[:, None], trial_response, response)
+        jacobian = np.where(better[:, None, None], trial_jacobian, jacobian)
+        residuals = np.where(better[:, None], trial_residuals, residuals)
+        cost = np.where(better, trial_cost, cost)
+        damping = np.where(better, damping/10, damping*10)
+        converged |= damping > 1e12
+        if converged.all(): break
+    return params, converged
+
+@dataclass
+class StandardCurve:
+    '''Standard curves of one model fitted to many plates, every array has one row per plate. lloq and uloq are the lowest
+    and highest concentrations of the standards used in each fit'''
+    model:str
+    params:np.ndarray
+    r_squared:np.ndarray
+    rmse:np.ndarray
+    converged:np.ndarray
+    lloq:np.ndarray
+    uloq:np.ndarray
+
+    def __len__(self)->int:
+        return len(self.params)
+
+    def predict(self, concentrations:np.ndarray)->np.ndarray:
+        '''Returns the plates x points responses at the concentrations, a 1-D array of concentrations is used for every plate'''
+        x = np.broadcast_to(np.asarray(concentrations, dtype=np.float64), (len(self), np.shape(concentrations)[-1]))
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if self.model == "linear": return self.params[:, [0]] + self.params[:, [1]]*x
+            if self.model == "log-linear": return self.params[:, [0]] + self.params[:, [1]]*np.log(x)
+            return _logistic(self.model, x, self.params)[0]
+
+    def inverse(self, responses:np.ndarray)->np.ndarray:
+        '''Returns the plates x points concentrations that give the responses, responses the curve never reaches are NaN'''
+        y = np.broadcast_to(np.asarray(responses, dtype=np.float64), (len(self), np.shape(responses)[-1]))
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if self.model == "linear": concentrations = (y-self.params[:, [0]])/self.params[:, [1]]
+            elif self.model == "log-linear": concentrations = np.exp((y-self.params[:, [0]])/self.params[:, [1]])
+            else:
+                a, b, log_c, d = [self.params[:, [index]] for index in range(4)]
+                ratio = (a-d)/(y-d)
+                if self.model == "5PL": ratio = ratio**np.exp(-np.clip(self.params[:, [4]], -10, 10))
+                concentrations = np.exp(log_c)*(ratio-1)**(1/b)
+        return np.where(np.isfinite(concentrations) & (concentrations > 0), concentrations, np.nan)
+
+    def flags(self, concentrations:np.ndarray)->np.ndarray:
+        '''Flags every concentration as IN_RANGE, BELOW_LLOQ, ABOVE_ULOQ or NOT_QUANTIFIABLE (NaN)'''
+        concentrations = np.asarray(concentrations, dtype=np.float64)
+        flags = np.full(np.broadcast_shapes(concentrations.shape, (len(self), 1)), IN_RANGE, dtype=np.int8)
+        flags[concentrations < self.lloq[:, None]] = BELOW_LLOQ
+        flags[concentrations > self.uloq[:, None]] = ABOVE_ULOQ
+        flags[np.broadcast_to(np.isnan(concentrations), flags.shape)] = NOT_QUANTIFIABLE
+        return flags
+
+def fit_curves(model:str, concentrations:np.ndarray, responses:np.ndarray)->StandardCurve:
+    '''Fits the model to the standards of every plate at once, concentrations and responses are plates x standards
+    (a 1-D array is one plate). NaN responses and concentrations that are not positive are left out of the fit'''
+    if model not in MODELS: raise ValueError(f"Unknown model {model!r}, expected one of {', '.join(MODELS)}")
+    x = np.atleast_2d(np.asarray(concentrations, dtype=np.float64))
+    y = np.atleast_2d(np.asarray(responses, dtype=np.float64))
+    x, y = np.broadcast_arrays(x, y)
+    used = np.isfinite(y) & np.isfinite(x) & ((x > 0) if model != "linear" else True)
+    weights = used.astype(np.float64)
+    safe_x = np.where(used, x, 1.0)
+    safe_y = np.where(used, y, 0.0)
+
+    if model in ("linear", "log-linear"):
+        # Weighted least squares of y = intercept + slope*t with t = x or ln(x), solved in closed form for every plate
+        t = safe_x if model == "linear" else np.log(safe_x)
+        count = weights.sum(axis=1)
+        t_mean = (t*weights).sum(axis=1)/count
+        y_mean = (safe_y*weights).sum(axis=1)/count
+        slope = (weights*(t-t_mean[:, None])*(safe_y-y_mean[:, None])).sum(axis=1)/(weights*(t-t_mean[:, None])**2).sum(axis=1)
+        params = np.stack([y_mean-slope*t_mean, slope], axis=1)
+        converged = np.isfinite(params).all(axis=1)
+    else:
+        params, converged = levenberg_marquardt(model, safe_x, safe_y, weights)
+
+    curve = StandardCurve(model, params, None, None, converged, np.where(used, x, np.inf).min(axis=1), np.where(used, x, -np.inf).max(axis=1))
+    residuals = (safe_y-curve.predict(safe_x))*weights
+    mean = (safe_y*weights).sum(axis=1)/weights.sum(axis=1)
+    ss_res = (residuals**2).sum(axis=1)
+    ss_tot = (((safe_y-mean[:, None])*weights)**2).sum(axis=1)
+    curve.r_squared = 1 - ss_res/ss_tot
+    curve.rmse = np.sqrt(ss_res/weights.sum(axis=1))
+    return curve
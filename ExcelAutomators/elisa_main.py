@@ -1,22 +1,39 @@
 import PrismAutomators.elisa_prism_automator as epa
 from Classes.ExcelWrapper import ExcelWrapper
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.Plate import Plate, reduce_replicates
+from Classes.PlateLayout import PlateLayout
 from Classes.Sample import Sample
+from Classes.RunRecorder import instrumented, note, current_run_id
+from Classes.CohortDatabase import SampleResult, get_database
+from Classes.PlateCache import get_plate_cache
+from Classes.PlateArchive import archive_export
+from Classes.ControlQC import plate_cutoffs
 from settings import *
+from typing import Callable
+import functools
 import os
 import statistics
 
+ELISA_LAYOUT = PlateLayout.from_settings()
 
+@functools.lru_cache
+def elisa_layout(sample_col:int|None = None, control_col:int|None = None)->PlateLayout:
+    '''Returns the layout of the plates whose samples and controls start in the given columns, ELISA_LAYOUT if none is given.
+    Layouts are kept so each one is only compiled once per plate shape'''
+    if sample_col is None and control_col is None: return ELISA_LAYOUT
+    return PlateLayout.from_settings(2, sample_col, control_col)
         
-def analyze_data(filepath:str, destination:str, samples:list[Sample],controls:list[Sample], replicates:int = 2) -> tuple[str,dict]:
+def analyze_data(filepath:str, destination:str, samples:list[Sample],controls:list[Sample], replicates:int = 2, export:SoftMaxExport = None,
+                 layout:PlateLayout = ELISA_LAYOUT) -> tuple[str,dict]:
     '''Creates Excel file out of text file and returns the new filepath and a dictionary to be passed into the prism automator'''
 
-    ewrapper = ExcelWrapper(filepath)
-    plate = ewrapper.get_cell_matrix(top_offset=3, left_offset=3, width=12, height=8, val_only=True)
+    ewrapper = ExcelWrapper(filepath, export)
+    plate = Plate(ewrapper.export.readings())
     controls.append(Sample("PosControl"))
     controls.append(Sample("NegControl"))
     controls.append(Sample("Blank"))
-    extract_values(plate, samples)
-    extract_values(plate, controls, start=len(samples)*2)
+    extract_values(plate, {"samples":samples, "controls":controls}, layout)
     control_ave = group_mean(controls[:-3])
     
     sample_labels = ["Sample Number"]
@@ -68,34 +85,38 @@ def analyze_data(filepath:str, destination:str, samples:list[Sample],controls:li
     
     sample_labels.extend([control.label for control in controls])
     
-    return destination, {
+    return new_dest, {
         "sample_labels":sample_labels[1:],
         "sample_averages":sample_averages[1:],
         "control_averages":control_averages[1:-3],
         "control_normalized":control_normalized_ave[1:-3],
         "sample_normalized":sample_normalized_ave[1:],
+        "raw_cutoff":raw_cutoff,
+        "normalized_cutoff":normalized_cutoff,
     }
     
 def calculate_cutoff(values:list[float|int])->int|float:
     '''Takes in a list if values and returns the cutoff according to the 2021 Bastard paper
-        cutoff = 3*stdev(values)+mean(values)
+        cutoff = 3*stdev(values)+median(values), see ControlQC.plate_cutoffs
     '''
 
-    return statistics.median(values) + (3*statistics.stdev(values))
+    return float(plate_cutoffs("elisa", [values])[0])
 
-def extract_values(plate:list[float],group:list[Sample], start = 0)->None:
-    '''Modifies the list of Samples and appends the number of associated values, i.e assumes each sample is run in duplicates and 8 samples per column'''
-    ROWS_PER_COL = 8
-    count = 0
-    for index in range(len(group)):
-        if index%ROWS_PER_COL == 0 and index != 0: count+=1
-        first = index if count < 1 else index + ROWS_PER_COL*count
-        second = first+ROWS_PER_COL
-        od1 = float(plate[first+start])
-        od2 = float(plate[second+start])
-        group[index].values.append(od1)
-        group[index].values.append(od2)
-        group[index].average = statistics.mean(group[index].values)
+def extract_values(plate:Plate, groups:dict[str, list[Sample]], layout:PlateLayout = ELISA_LAYOUT)->None:
+    '''Modifies the lists of Samples and appends the associated values, the wells of every group are looked up in the layout,
+    by default the samples start in the SAMPLE_COLUMNS and the controls in the CONTROL_COLUMNS run in duplicates. Raises a
+    ValueError naming the samples with an empty well, a sample is never averaged from fewer replicates than it has'''
+    compiled = layout.compile(plate.shape, {name:len(group) for name, group in groups.items()})
+    ods = compiled.gather(plate)
+    averages = reduce_replicates(ods, "mean")
+    unread = compiled.unread(averages, {name:[sample.label for sample in group] for name, group in groups.items()})
+    if unread: raise ValueError(f"The export has empty wells, no reading for {', '.join(unread)}")
+    averages = compiled.split(averages)
+    ods = compiled.split(ods)
+    for name, group in groups.items():
+        for sample, values, average in zip(group, ods[name].tolist(), averages[name].tolist()):
+            sample.values.extend(values)
+            sample.average = average
 
 def normalize_values(group:list[Sample], normalizer:float|int)->None:
     '''Normalizes a list of Samples by dividing each Sample.average by the normalizer'''
@@ -111,11 +132,34 @@ def group_mean(group:list[Sample])->float|int:
     '''Returns the mean of the Sample.average of a list of Samples'''
     return statistics.mean([sample.average for sample in group])
          
-def main(filepath:str, destination:str, samples:list[int], controls:list[int], sample_col:int = 1, control_col:int = 8):
-    '''Analyzes ELISA text file data from optical density machine, assumes the samples always start at column 1 and the controls always start at column 8'''
-    print(samples, controls)
+def save_run(filepath:str, output:str, samples:list[Sample], controls:list[Sample], data:dict, cohort:str|None = None, update_cohort:bool = False)->int:
+    '''Saves the raw and normalized ODs and the cutoffs of every sample and control of the plate to the database, with
+    update_cohort the ODs of the cohort's existing samples are updated too so the neutralization runs read the current values'''
+    cutoffs = {"raw_cutoff":data["raw_cutoff"], "normalized_cutoff":data["normalized_cutoff"]}
+    results = [SampleResult(str(sample.label), is_control, rawod=sample.average, normalizedod=sample.normalized_average, **cutoffs)
+               for group, is_control in ((samples, False), (controls, True)) for sample in group]
+    return get_database().save_run(current_run_id(), "elisa", filepath, results, get_plate_cache().digest(filepath), output, cohort, update_cohort)
+
+@instrumented("elisa")
+def main(filepath:str, destination:str, samples:list[int], controls:list[int], sample_col:int|None = None, control_col:int|None = None, export:SoftMaxExport = None, open_excel:bool = True,
+         cohort:str|None = None, update_cohort:bool = False, save_results:bool = SAVE_RESULTS, progress:Callable[[str, int, int], None] = None)->str:
+    '''Analyzes ELISA text file data from optical density machine, the samples start at column sample_col and the controls at column control_col,
+    the SAMPLE_COLUMNS and CONTROL_COLUMNS by default, see PlateLayout.from_settings. Returns the filepath of the new Excel file. With save_results the results are saved to the database, see save_run, the cohort
+    is only recorded with them unless update_cohort is set. The raw readings of the plate are added to the PlateArchive.
+    progress is called with the name, index and number of stages before each stage'''
+    note(samples=len(samples), controls=len(controls))
     samples  = [Sample(sample) for sample in samples]
     controls = [Sample(control) for control in controls]
-    new_file, data = analyze_data(filepath, destination, samples,controls)
+    layout = elisa_layout(sample_col, control_col)
+    steps = 4 if save_results else 3
+    if progress: progress("Analyzing plate and writing Excel file", 0, steps)
+    new_file, data = analyze_data(filepath, destination, samples,controls, export=export, layout=layout)
+    if progress: progress("Writing Prism file", 1, steps)
     epa.main(data, new_file)
-    os.system(f'start excel "{new_file}"')
\ No newline at end of file
+    if save_results:
+        if progress: progress("Saving results", 2, steps)
+        save_run(filepath, new_file, samples, controls, data, cohort, update_cohort)
+    if progress: progress("Archiving plate", steps - 1, steps)
+    archive_export(filepath, "elisa", current_run_id(), cohort, layout.name, export)
+    if open_excel: os.system(f'start excel "{new_file}"')
+    return new_file
\ No newline at end of file
@@ -1,31 +1,58 @@
 from Classes.ExcelWrapper import ExcelWrapper
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.Plate import Plate, reduce_replicates
+from Classes.PlateLayout import PlateLayout, CompiledLayout
 from Classes.Sample import Sample
+from Classes.RunRecorder import instrumented, note, stage, current_run_id
+from Classes.PlateArchive import archive_export
+from Classes.StandardCurve import StandardCurve, fit_curves
+from settings import *
 from typing import Callable
-import statistics
-import math
+import numpy as np
 import os
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
+DUPLICATES_LAYOUT = PlateLayout({
+    "name":"elisa_standards_duplicates",
+    "groups":[
+        {"name":"samples", "replicates":2, "start":"A1"},
+        {"name":"standards", "replicates":2, "follows":"samples"},
+    ]
+})
+TRIPLICATES_LAYOUT = PlateLayout({
+    "name":"elisa_standards_triplicates",
+    "groups":[
+        {"name":"samples", "replicates":3, "start":"A1"},
+        {"name":"standards", "replicates":3, "follows":"samples"},
+    ]
+})
 
+@instrumented("elisa_standards")
 def main(filepath:str, destination:str, samples:list[str], \
         *standard_args,\
         replicates:str = "2", neg_control:str = "IgG1, Kappa Isotype AB", blank:str = "IgG Depleted Serum",\
-        prefix:str = None)->None:
+        prefix:str = None, export:SoftMaxExport = None, model:str = STANDARD_CURVE_MODEL, show_plot:bool|Callable[[str], None] = True, progress:Callable[[str, int, int], None] = None)->str:
     
-    '''User selects whether the samples were run in duplicates or triplicates. The average of the replicates of the samples, standards and any controls are calculated, using
-        linear regression the concentration of the samples is determined from the slope of the linear regression calculated from the standards.
+    '''User selects whether the samples were run in duplicates or triplicates. The average of the replicates of the samples, standards and any controls are calculated,
+        the model (linear, log-linear, 4PL or 5PL) is fitted to the standards and the concentration of the samples is read back from the fitted curve.
         Assumes the standards are always on the right hand side of the plate and the IgG isotype control is on the bottom of the standards, the rest of the wells contain samples.
-        Assumes the highest concentration of the standard is 1 ug/mL and the dilution factor is 2x by default
+        Assumes the highest concentration of the standard is 1 ug/mL and the dilution factor is 2x by default, returns the filepath of the new Excel file
+        The standard curve is saved next to the Excel file in the PLOT_FORMATS, show_plot opens a preview of it if a Qt application is running,
+        it can also be a function that is handed the path of the image to show it later i.e from the GUI thread.
+        The raw readings of the plate are added to the PlateArchive.
+        progress is called with the name, index and number of stages before each stage
     '''
     
     DUPLICATES = 2
     TRIPLICATES = 3
     
     
-    ewrapper = ExcelWrapper(filepath)
+    if progress: progress("Reading plate", 0, 4)
+    ewrapper = ExcelWrapper(filepath, export)
     new_dest = '/'.join([destination,filepath.replace(".txt", ".xlsx").split('/')[-1]])
     
-    plate = ewrapper.get_cell_matrix(top_offset=3, left_offset=3, width=12, height=8, val_only=True)
+    plate = Plate(ewrapper.export.readings())
 
     standard_labels, standard_concentrations, units = process_standards(standard_args)
 
@@ -36,28 +63,32 @@ def main(filepath:str, destination:str, samples:list[str], \
     replicates = int(replicates)
     
     if replicates == DUPLICATES: 
-        extract_duplicates(plate, samples)
-        extract_duplicates(plate, standards, starting_index=len(samples)*2)
+        extract_duplicates(plate, samples, standards)
     elif replicates == TRIPLICATES:
-        extract_triplicates(plate, samples)
-        extract_triplicates(plate, standards, starting_index=len(samples)*3)
+        extract_triplicates(plate, samples, standards)
 
-    #inverse_lr_equation,lr_equation, r_squared = get_linear_regression_function([standard.ab_concentration for standard in standards[:-2]], [standard.average for standard in standards[:-2]])
-    inverse_ln_equation, ln_equation, ln_r_squared = get_logarithmic_regression_function([standard.ab_concentration for standard in standards[:-2]], [standard.average for standard in standards[:-2]])
+    if progress: progress("Fitting standard curve", 1, 4)
+    standard_conc = [standard.ab_concentration for standard in standards[:-2]]
+    curve = fit_curves(model, standard_conc, [standard.average for standard in standards[:-2]])
+    read_concentrations(curve, samples + standards[-2:])
+    r_squared = float(curve.r_squared[0])
+    note(model=model, r_squared=r_squared, converged=bool(curve.converged[0]))
     
-    
-    # for sample in samples:sample.ab_concentration = inverse_lr_equation(sample.average)
-    # for control in standards[-2:]: control.ab_concentration = inverse_lr_equation(control.average)
-    
-    for sample in samples:sample.ab_concentration = inverse_ln_equation(sample.average)
-    for control in standards[-2:]: control.ab_concentration = inverse_ln_equation(control.average)
-    
-    if replicates == DUPLICATES: write_duplicates(ewrapper, samples, standards, ln_r_squared)
-    elif replicates == TRIPLICATES: write_triplicates(ewrapper, samples, standards, ln_r_squared)
+    if progress: progress("Writing Excel file", 2, 4)
+    if replicates == DUPLICATES: write_duplicates(ewrapper, samples, standards, r_squared)
+    elif replicates == TRIPLICATES: write_triplicates(ewrapper, samples, standards, r_squared)
    
     ewrapper.write_excel(new_dest)
     #os.system(f'start excel "{new_dest}"')
-    regression_plot(ln_equation, [standard.average for standard in standards[:-2]], [standard.ab_concentration for standard in standards[:-2]], samples, ln_r_squared, units)
+    with stage("Saving standard curve plot"):
+        images = regression_plot(new_dest.replace(EXCEL_EXT, ""), standard_conc, [standard.average for standard in standards[:-2]], curve.predict(standard_conc)[0].tolist(),
+                                 [(sample.label, sample.ab_concentration, sample.average) for sample in samples if sample.ab_concentration is not None], r_squared, units)
+    if progress: progress("Archiving plate", 3, 4)
+    layout = DUPLICATES_LAYOUT if replicates == DUPLICATES else TRIPLICATES_LAYOUT
+    archive_export(filepath, "elisa_standards", current_run_id(), layout=layout.name, export=ewrapper.export)
+    if callable(show_plot): show_plot(images[0])
+    elif show_plot: show_preview(images[0])
+    return new_dest
 
 def write_duplicates(ewrapper:ExcelWrapper, samples:list[Sample], standards:list[Sample], r_squared:float)->None:
     '''Contains the logic to write the values to an excel file assuming duplicates'''
@@ -180,23 +211,14 @@ def write_triplicates(ewrapper:ExcelWrapper, samples:list[Sample], standards:lis
     ewrapper.add_column("AI", sample_od_average_std)
     ewrapper.add_column("AJ", sample_ab_concentration)
 
-def get_linear_regression_function(x_values:list[float], y_values:list[float])->tuple[Callable[[float], float], Callable[[float], float], float]:
-    '''Returns the inverse linear regression function, linear regression function and R-squared value that are derived from standards, 
-    the inverse linear function is used to calculate the concentration of AB relative to the OD values of the standards'''
-    slope, intercept = statistics.linear_regression(x_values, y_values)
-    r_squared = statistics.correlation(x_values, y_values)**2 #The sqaure of the pearson coeffecient is the coefficient of determination
-    print("The slope of the linear regression line is: ", slope, "\nThe intercept is: ", intercept, "\nThe R-squared value is: ", r_squared)
-    return lambda y: (y-intercept)/slope, lambda x:slope*x+intercept, r_squared
+def read_concentrations(curve:StandardCurve, samples:list[Sample])->None:
+    '''Sets the ab_concentration of every Sample from its average OD in one call to the fitted curve, ODs the curve never reaches
+    are left as None'''
+    concentrations = curve.inverse([sample.average for sample in samples])[0]
+    for sample, concentration in zip(samples, concentrations.tolist()):
+        sample.ab_concentration = None if np.isnan(concentration) else concentration
+    return None
 
-def get_logarithmic_regression_function(x_values:list[float], y_values:list[float])->tuple[Callable[[float], float], Callable[[float], float], float]:
-    '''Returns the inverse logarithmic regression function, logarithmic regression function and R-squared value that are derived from standards, 
-    the inverse logarithmic function is used to calculate the concentration of AB relative to the OD values of the standards'''
-    ln_x_values = [math.log(x) for x in x_values]
-    slope, intercept = statistics.linear_regression(ln_x_values, y_values)
-    r_squared = statistics.correlation(ln_x_values, y_values)
-    print("The slope of the logarithmic regression line is: ", slope, "\nThe intercept is: ", intercept, "\nThe R-squared value is: ", r_squared)
-    return lambda y: math.exp((y-intercept)/slope), lambda x: slope*math.log(x)+intercept, r_squared
-    
 def determine_standards(starting_conc:str, suffix:str, dilution_factor:str, dilutions:str = "6")->tuple[list[str], list[float], str]:
     '''Returns a list of strings containing the labels used for the standards based of the starting concentration and the dilution factor, assumes the starting
         concentration is diluted 6 times.
@@ -214,56 +236,65 @@ def determine_standards(starting_conc:str, suffix:str, dilution_factor:str, dilu
         concentrations.append(prv)
     return (labels, concentrations, suffix)
 
-def extract_duplicates(plate:list[float],group:list[Sample], starting_index = 0)->None:
-    '''Modifies the list of Samples and appends the number of associated values, i.e assumes each sample is run in duplicates and 8 samples per column,
-        The starting index refers to the point at which the values from the plate should be extracted
+def extract_duplicates(plate:Plate, samples:list[Sample], standards:list[Sample])->None:
+    '''Modifies the lists of Samples and appends the associated values, i.e assumes each sample is run in duplicates and 8 samples per column,
+        the standards are packed right after the samples, negative ODs are set to 0
     '''
-    ROWS_PER_COL = 8
-    AMOUNT_OF_COLUMNS_TO_SKIP_OVER = 1
-    count = 0
-    for index in range(len(group)):
-        if index%ROWS_PER_COL == 0 and index != 0: count+=1
-        first = index if count < 1 else index + ROWS_PER_COL*count*AMOUNT_OF_COLUMNS_TO_SKIP_OVER
-        second = first+ROWS_PER_COL
-        od1 = float(plate[first+starting_index])
-        od2 = float(plate[second+starting_index])
-        group[index].values.append(od1 if od1 >= 0 else 0)
-        group[index].values.append(od2 if od2 >= 0 else 0)
-        group[index].average = round(statistics.mean(group[index].values), 4) 
-        group[index].std = round(statistics.stdev(group[index].values), 4)
+    compiled = DUPLICATES_LAYOUT.compile(plate.shape, {"samples":len(samples), "standards":len(standards)})
+    ods = compiled.gather(plate)
+    assign_replicates(compiled, np.maximum(ods, 0), {"samples":samples, "standards":standards}, ods < 0)
         
-def extract_triplicates(plate:list[float],group:list[Sample], starting_index = 0)->None:
-    '''Modifies the list of Samples and appends the number of associated values, i.e assumes each sample is run in duplicates and 8 samples per column,
-        The starting index refers to the point at which the values from the plate should be extracted
+def extract_triplicates(plate:Plate, samples:list[Sample], standards:list[Sample])->None:
+    '''Modifies the lists of Samples and appends the associated values, i.e assumes each sample is run in triplicates and 8 samples per column,
+        the standards are packed right after the samples
     '''
-    ROWS_PER_COL = 8
-    AMOUNT_OF_COLUMNS_TO_SKIP_OVER = 2
-    count = 0
-    for index in range(len(group)):
-        if index%ROWS_PER_COL == 0 and index != 0: count+=1
-        first = index if count < 1 else index + ROWS_PER_COL*count*AMOUNT_OF_COLUMNS_TO_SKIP_OVER
-        second = first+ROWS_PER_COL
-        third = second+ROWS_PER_COL
-        od1 = float(plate[first+starting_index])
-        od2 = float(plate[second+starting_index])
-        od3 = float(plate[third+starting_index])
-        group[index].values.append(od1)
-        group[index].values.append(od2)
-        group[index].values.append(od3)
-        group[index].average = round(statistics.mean(group[index].values), 4)
-        group[index].std = round(statistics.stdev(group[index].values, xbar=1),4)
+    compiled = TRIPLICATES_LAYOUT.compile(plate.shape, {"samples":len(samples), "standards":len(standards)})
+    assign_replicates(compiled, compiled.gather(plate), {"samples":samples, "standards":standards})
+
+def assign_replicates(compiled:CompiledLayout, ods:np.ndarray, groups:dict[str, list[Sample]], clipped:np.ndarray|None = None)->None:
+    '''Stores the replicate ODs, their rounded average and rounded sample standard deviation on each Sample, raises a ValueError
+    naming the samples with an empty well. The clipped ODs are stored as the integer 0 like the negative ODs always were, so a
+    sample whose ODs are all clipped is written as "0 (0.0)"'''
+    stats = reduce_replicates(ods, "mean", "std")
+    unread = compiled.unread(stats["mean"], {name:[sample.label for sample in group] for name, group in groups.items()})
+    if unread: raise ValueError(f"The export has empty wells, no reading for {', '.join(unread)}")
+    averages = compiled.split(stats["mean"])
+    stds = compiled.split(stats["std"])
+    ods = compiled.split(ods)
+    clipped = compiled.split(np.ma.filled(clipped, False) if clipped is not None else np.zeros(compiled.indices.shape, dtype=bool))
+    for name, group in groups.items():
+        for sample, values, average, std, zeros in zip(group, ods[name].tolist(), averages[name].tolist(), stds[name].tolist(), clipped[name].tolist()):
+            sample.values.extend(0 if zero else value for value, zero in zip(values, zeros))
+            sample.average = 0 if all(zeros) else round(average, 4)
+            sample.std = round(std, 4)
+
+def regression_plot(destination:str, standard_conc:list[float], standard_ods:list[float], fitted_ods:list[float], samples:list[tuple[str, float, float]], r_squared:float, unit:str, formats:list[str] = PLOT_FORMATS)->list[str]:
+    '''Draws the standards, the fitted curve and the (label, concentration, OD) of every sample on its own Figure with the Agg
+    backend and saves it as destination.png, destination.svg etc. Nothing is shown and pyplot is not used so it can run on any
+    thread or in a worker process, returns the paths of the images'''
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(standard_conc, standard_ods, "go")
+    axes.plot(standard_conc, fitted_ods, label = f"R-squared: {round(r_squared, 3)}")
+    axes.legend(loc = "upper center")
+    axes.plot([conc for _, conc, _ in samples], [od for _, _, od in samples], "ro")
+    for label, conc, od in samples: axes.text(conc, od, label)
+    axes.set_xlabel(f"Ab Concentration ({unit})")
+    axes.set_ylabel("Optical Density")
+    images = [f"{destination}.{image_format}" for image_format in formats]
+    for image in images: figure.savefig(image)
+    return images
 
-def regression_plot(inv_reg_equation:Callable[[float], float], standard_ods:list[float], standard_conc:list[float], samples:list[Sample], r_squared:float, unit:str)->None:
-    '''Adds a set of data points to the matplotlib graph instance to show later'''
-    plt.plot(standard_conc, standard_ods, "go")
-    plt.plot(standard_conc,[inv_reg_equation(c) for c in standard_conc], label = f"R-squared: {round(r_squared, 3)}")
-    plt.legend(loc = "upper center")
-    plt.plot([sample.ab_concentration for sample in samples], [sample.average for sample in samples], "ro")
-    for sample in samples:
-        plt.text(sample.ab_concentration, sample.average, sample.label)
-    plt.xlabel(f"Ab Concentration ({unit})")
-    plt.ylabel("Optical Density")
-    plt.show()
+def show_preview(image:str)->None:
+    '''Opens a PlotPreview window of the image when called from the thread of a running Qt application, otherwise does nothing'''
+    from PyQt5.QtCore import QThread
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance()
+    if app is None or app.thread() != QThread.currentThread(): return None
+    from Classes.PlotPreview import PlotPreview
+    PlotPreview(image).show()
+    return None
 
 def process_standards(standard_args:list[str])->tuple[list[str], list[float], str]:
     '''Takes in the args passed in by the front end and determines if they came from the
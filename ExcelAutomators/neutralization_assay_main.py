@@ -1,25 +1,27 @@
 from Classes.ExcelWrapper import ExcelWrapper
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.Plate import Plate, reduce_replicates
+from Classes.PlateLayout import load_layout
+from Classes.CohortDatabase import SampleResult, get_database
+from Classes.PlateCache import get_plate_cache
+from Classes.PlateArchive import archive_export
+from Classes.ControlQC import plate_cutoffs
+from Classes.RunRecorder import instrumented, current_run_id
+from settings import *
+from typing import Callable
 import PrismAutomators.neutralization_assay_prism_automator as npa
 import statistics
-import sqlite3
 import os
 
-cur = sqlite3.connect("Databases/NeutralizationAssayDB.sqlite").cursor()
+cohort_db = get_database()
 
-def flatten_list(lists:list)->list:
-    '''flattens inner lists into 1 list, goes 1 level deep only'''
-    flattened = []
-    for item in lists:
-        if type(item) == list:
-            for inner_item in item: flattened.append(inner_item)
-        else:
-            flattened.append(item)
-        
-    return flattened
+# Stimulation of the lower and higher half of the plate and the labels of the plate controls of each half, as in the Excel file
+CONDITIONS = {"lower":"0.1ng/mL", "higher":"10ng/mL"}
+PLATE_CONTROLS = ["hAnti-IFNa", "hIgG", "Not Stimulated"]
 
 def calculate_cutoff(values:list[int|float])->int|float:
-    '''Calculates the cutoff according to the Bastard et al 2021 paper, 0.15(median(controls))'''
-    return statistics.median(values)*0.15
+    '''Calculates the cutoff according to the Bastard et al 2021 paper, 0.15(median(controls)), see ControlQC.plate_cutoffs'''
+    return float(plate_cutoffs("neutralization", [values])[0])
 
 def calculate_averages(*values:list[int|float])->list[int|float]:
     '''Averages the values between the lists passed within the same index, 
@@ -36,18 +38,20 @@ def calculate_averages(*values:list[int|float])->list[int|float]:
         current_index.clear()
     return averages
 
-def get_patient_serum(half:dict[str, list])->list:
-    '''Returns the first 4 columns from a plate half as a list'''
-    return flatten_list([half[key] for index, key in enumerate(half.keys()) if index < 4])
+def save_run(file:str, output:str, cohort:str|None, sample_numbers:list[str], mir_controls:list[str], wells:dict[str, list[float]])->int:
+    '''Saves the FLU/RLU of every patient, MIR control and plate control of both halves of the plate to the database together
+    with the cutoff of its half'''
+    results = []
+    for half, condition in CONDITIONS.items():
+        cutoff = calculate_cutoff([float(mir) for mir in wells[f"{half}_mirs"]])
+        plate_controls = wells[f"{half}_pos_control"] + wells[f"{half}_neg_control"] + wells[f"{half}_no_stimulation"]
+        for labels, values, is_control in ((sample_numbers, wells[f"{half}_patients"], False), (mir_controls, wells[f"{half}_mirs"], True), (PLATE_CONTROLS, plate_controls, True)):
+            results.extend(SampleResult(str(label), is_control, condition, flu_rlu=value, flu_rlu_cutoff=cutoff) for label, value in zip(labels, values))
+    return cohort_db.save_run(current_run_id(), "neutralization", file, results, get_plate_cache().digest(file), output, cohort)
 
-def get_mir_serum(half:dict[str, list])->list:
-    return flatten_list([half[key] for index, key in enumerate(half.keys()) if index >= 4 and index < 6])
-
-def get_controls(half:dict[str, list])->list:
-    return flatten_list([half[key] for index, key in enumerate(half.keys()) if index >= 6])
-
-
-def neutralization_assay_singlets(file:str, destination:str, cohort:str=None, sample_numbers:list[str]= None, mir_controls:list[str]=None)->None:
+@instrumented("neutralization")
+def neutralization_assay_singlets(file:str, destination:str, cohort:str=None, sample_numbers:list[str]= None, mir_controls:list[str]=None, export:SoftMaxExport = None, open_excel:bool = True,
+                                  save_results:bool = SAVE_RESULTS, progress:Callable[[str, int, int], None] = None)->str:
     '''Analyzes the text file produced from the Optical Plate reader assumptions:
         - Half the 96 well plate is used for 0.1ng/mL, other half for 10ng/mL protein stimulation
         - Same cohort is tested on both halves of the 96 well plate
@@ -55,44 +59,32 @@ def neutralization_assay_singlets(file:str, destination:str, cohort:str=None, sa
         - 1 Pos Control (1ug/mL of human Anti-IFNa2)
         - 1 Neg Control (1ug/mL of non-specific IgG)
         - Last well in both halves has no stimulation(No recombinant protein added)
-        See layout here: "Neutralization_Assay_Procedure_for_IFNa2_and_IFNw Singlets.docx"
+        See layout here: "Neutralization_Assay_Procedure_for_IFNa2_and_IFNw Singlets.docx", the wells are described in NEUTRALIZATION_LAYOUT
+        Returns the filepath of the new Excel file, with save_results the FLU/RLUs are saved to the database, see save_run.
+        The raw readings of every block of the export are added to the PlateArchive.
+        progress is called with the name, index and number of stages before each stage
     '''
 
-    ewrapper = ExcelWrapper(file)
+    steps = 5 if save_results else 4
+    if progress: progress("Reading plate", 0, steps)
+    ewrapper = ExcelWrapper(file, export)
+    plate = Plate(ewrapper.export.readings(NEUTRALIZATION_BLOCK))
+    compiled = load_layout(NEUTRALIZATION_LAYOUT).compile(plate.shape)
+    flus_rlus = reduce_replicates(compiled.gather(plate), "mean")
+    unread = compiled.unread(flus_rlus)
+    if unread: raise ValueError(f"The export has empty wells, no reading for {', '.join(unread)}")
+    wells = {name:values.tolist() for name, values in compiled.split(flus_rlus).items()}
     
     if cohort:
-        sample_numbers = [[sample][0][0] for sample in cur.execute(f"SELECT label FROM {cohort} WHERE label NOT LIKE 'MIR%' AND NOT excluded ORDER BY rowid").fetchall()]
-        mir_controls = [[control][0][0] for control in cur.execute(f"SELECT label FROM {cohort} WHERE label LIKE 'MIR%' AND NOT excluded ORDER BY rowid").fetchall()]
-    
-   
-    first_half = {
-        "first_col": ewrapper.get_column("C", 14, 22, True),
-        "second_col":ewrapper.get_column("D", 14, 22, True),
-        "third_col":ewrapper.get_column("E", 14, 22, True),
-        "fourth_col":ewrapper.get_column("F", 14, 22, True),
-        "fifth_col":ewrapper.get_column("G", 14, 22, True),
-        "sixth_col":ewrapper.get_column("H", 14, 19, True),
-        "pos_control":ewrapper.get_column("H", 19, 20, True),
-        "neg_control":ewrapper.get_column("H", 20, 21, True),
-        "no_stimulation":ewrapper.get_column("H", 21, 22, True),
-    }
-    
-    second_half = {
-        "first_col": ewrapper.get_column("I", 14, 22, True),
-        "second_col":ewrapper.get_column("J", 14, 22, True),
-        "third_col":ewrapper.get_column("K", 14, 22, True),
-        "fourth_col":ewrapper.get_column("L", 14, 22, True),
-        "fifth_col":ewrapper.get_column("M", 14, 22, True),
-        "sixth_col":ewrapper.get_column("N", 14, 19, True),
-        "pos_control":ewrapper.get_column("N", 19, 20, True),
-        "neg_control":ewrapper.get_column("N", 20, 21, True),
-        "no_stimulation":ewrapper.get_column("N", 21, 22, True),
-    }
+        sample_numbers = cohort_db.labels(cohort)
+        mir_controls = cohort_db.labels(cohort, controls=True)
     
-    first_half_mirs_flus_rlus = get_mir_serum(first_half)
-    second_half_mirs_flus_rlus = get_mir_serum(second_half)
-    first_half_patient_flus_rlus = get_patient_serum(first_half)
-    second_half_patient_flus_rlus = get_patient_serum(second_half)
+    first_half_mirs_flus_rlus = wells["lower_mirs"]
+    second_half_mirs_flus_rlus = wells["higher_mirs"]
+    first_half_patient_flus_rlus = wells["lower_patients"]
+    second_half_patient_flus_rlus = wells["higher_patients"]
+    first_half_controls = wells["lower_pos_control"] + wells["lower_neg_control"] + wells["lower_no_stimulation"]
+    second_half_controls = wells["higher_pos_control"] + wells["higher_neg_control"] + wells["higher_no_stimulation"]
     
     ewrapper.add_column("Q", ["Patient Sample Number"])
     ewrapper.add_column("Q", sample_numbers, 2)
@@ -105,7 +97,7 @@ def neutralization_assay_singlets(file:str, destination:str, cohort:str=None, sa
     ewrapper.add_column("S", ["Not Stimulated"],len(mir_controls)+4)
     ewrapper.add_column("T", ["0.1ng/mL Control FLU/RLU"])
     ewrapper.add_column("T", first_half_mirs_flus_rlus, 2)
-    ewrapper.add_column("T", get_controls(first_half),len(first_half_mirs_flus_rlus)+2) # + length of the mirs list 
+    ewrapper.add_column("T", first_half_controls,len(first_half_mirs_flus_rlus)+2) # + length of the mirs list 
     ewrapper.add_column("U", ["Cutoff", calculate_cutoff([float(mir) for mir in first_half_mirs_flus_rlus])]) #need to convert 'str' in mirs list to 'float'
     
     ewrapper.add_column("W", ["Patient Sample Number"])
@@ -119,29 +111,37 @@ def neutralization_assay_singlets(file:str, destination:str, cohort:str=None, sa
     ewrapper.add_column("Y", ["Not Stimulated"],len(mir_controls)+4)
     ewrapper.add_column("Z", ["10ng/mL Control FLU/RLU"])
     ewrapper.add_column("Z", second_half_mirs_flus_rlus, 2)
-    ewrapper.add_column("Z", get_controls(second_half),len(second_half_mirs_flus_rlus)+2) # +2 is used since the column and the mir serum takes up more rows that just the length of the mirs list 
+    ewrapper.add_column("Z", second_half_controls,len(second_half_mirs_flus_rlus)+2) # +2 is used since the column and the mir serum takes up more rows that just the length of the mirs list 
     ewrapper.add_column("AA", ["Cutoff", calculate_cutoff([float(mir) for mir in second_half_mirs_flus_rlus])]) #need to convert 'str' in mirs list to 'float'
     
     new_dest = '/'.join([destination,file.replace(".txt", ".xlsx").split('/')[-1]])
+    if progress: progress("Writing Excel file", 1, steps)
     ewrapper.write_excel(new_dest)
-    os.system(f'start excel "{new_dest}"')
+    if open_excel: os.system(f'start excel "{new_dest}"')
+    if progress: progress("Writing Prism file", 2, steps)
     npa.main(file, destination,cohort,{
         "sample_numbers":sample_numbers,
         "mir_numbers":mir_controls,
         "sample_flus_rlus":first_half_patient_flus_rlus,
         "mirs_flus_rlus":first_half_mirs_flus_rlus,
-        "pos":first_half["pos_control"],
-        "neg":first_half["neg_control"],
-        "ns":first_half["no_stimulation"],
+        "pos":wells["lower_pos_control"],
+        "neg":wells["lower_neg_control"],
+        "ns":wells["lower_no_stimulation"],
     }, {
         "sample_numbers":sample_numbers,
         "mir_numbers":mir_controls,
         "sample_flus_rlus":second_half_patient_flus_rlus,
         "mirs_flus_rlus":second_half_mirs_flus_rlus,
-        "pos":second_half["pos_control"],
-        "neg":second_half["neg_control"],
-        "ns":second_half["no_stimulation"],
+        "pos":wells["higher_pos_control"],
+        "neg":wells["higher_neg_control"],
+        "ns":wells["higher_no_stimulation"],
     })
+    if save_results:
+        if progress: progress("Saving results", 3, steps)
+        save_run(file, new_dest, cohort, sample_numbers, mir_controls, wells)
+    if progress: progress("Archiving plate", steps - 1, steps)
+    archive_export(file, "neutralization", current_run_id(), cohort, load_layout(NEUTRALIZATION_LAYOUT).name, ewrapper.export)
+    return new_dest
     
     
 #The code below is a "unit test" to verify that the script works, need to create mure unit tests in the future
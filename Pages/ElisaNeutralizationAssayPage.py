@@ -1,27 +1,41 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QFileDialog, QPushButton, QLineEdit, QMessageBox, QComboBox
-from PyQt5.QtGui import QFont, QPixmap
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import QTimer
 from Classes.ErrorMessageBox import ErrorMessageBox
+from Classes.LogoLabel import LogoLabel
+from Classes.JobStatusWidget import JobStatusWidget
+from Classes.AnalysisQueue import get_queue
 from settings import *
-import ExcelAutomators.elisa_main as em
-import ExcelAutomators.neutralization_assay_main as nam
-import sqlite3
 
 class CohortSelectionComboBox(QComboBox):
 
     def __init__(self):
+        '''The cohorts are not looked up while the window is built, the list is filled once the event loop is running and
+        refreshed every time the list is opened'''
         super().__init__()
-        self.query_sqlite3_db()
-        
+        self.addItem("")
+        self.database = None
+        self.summary = None
+        QTimer.singleShot(0, self.query_sqlite3_db)
+
     def query_sqlite3_db(self):
+        if self.database is None:
+            from Classes.CohortDatabase import get_database
+            self.database = get_database()
+        summary = self.database.summary()
+        if summary is self.summary: return
+        selected = self.currentText()
+        self.summary = summary
+        self.blockSignals(True)
+        self.clear()
         self.addItem("")
-        table_prefix = "cohort"
-        cur = sqlite3.connect("Databases/NeutralizationAssayDB.sqlite").cursor()
-        for num in range(1,24):
-            cur.execute(f"SELECT label FROM {table_prefix}{num} WHERE label NOT LIKE 'MIR%'")
-            data = cur.fetchall()
-            first_sample = data[0][0]
-            last_sample = data[-1][0]
-            self.addItem(f"{table_prefix}{num}-> Sample Numbers({first_sample} - {last_sample})")
+        for cohort in summary: self.addItem(f"{cohort.cohort}-> Sample Numbers({cohort.first_sample} - {cohort.last_sample})")
+        self.setCurrentIndex(max(self.findText(selected), 0))
+        self.blockSignals(False)
+
+    def showPopup(self):
+        self.query_sqlite3_db()
+        super().showPopup()
             
 
 class ElisaNeutralizationAssayPage(QWidget):
@@ -51,9 +65,7 @@ class ElisaNeutralizationAssayPage(QWidget):
         self.elisa_button = QPushButton('Process ELISA Data')
         self.neutralization_assay_button = QPushButton("Process Neutralization Assay Data")
         select_file_destination = QPushButton('Select File Destination')
-        self.logo_image = QPixmap('./Images/logo2.png')
-        self.logo_label = QLabel()
-        self.logo_label.setPixmap(self.logo_image.scaled(600,450))
+        self.logo_label = LogoLabel()
         self.cohort_combobox = CohortSelectionComboBox()
         self.button = QPushButton("Click me to switch pages")
         self.button.clicked.connect(lambda:parent.setCurrentIndex(1 if parent.currentIndex() != 1 else 0))
@@ -79,6 +91,8 @@ class ElisaNeutralizationAssayPage(QWidget):
         self.layout().addWidget(select_file_destination)
         self.layout().addWidget(self.elisa_button)
         self.layout().addWidget(self.neutralization_assay_button)
+        self.job_status = JobStatusWidget(self)
+        self.layout().addWidget(self.job_status)
         
         self.raw_data_filepath = False
         self.destination_filepath = False
@@ -100,10 +114,21 @@ class ElisaNeutralizationAssayPage(QWidget):
             ErrorMessageBox('No Folder Selected')
             return
         
+        # Imported here so the analysis modules are only loaded once there is something to process
+        import ExcelAutomators.elisa_main as em
+        try:
+            sample_col = int(self.start_sample_column.text()) if self.start_sample_column.text().strip() else None
+            control_col = int(self.start_control_column.text()) if self.start_control_column.text().strip() else None
+            # Checked here so a layout that does not fit is reported before the job is queued
+            em.elisa_layout(sample_col, control_col)
+        except ValueError as error:
+            ErrorMessageBox(f'Invalid start column: {error}')
+            return
         try:
             sample_cohort = self.sample_cohort(self.starting_sample_num.text(), self.last_sample_num.text(), self.exclude_nums.text().split(','))
             control_cohort = self.control_cohort(self.starting_control_num.text(),self.last_control_num.text(),self.excluded_controls.text().split(','))
-            em.main(self.raw_data_filepath, self.destination_filepath, sample_cohort, control_cohort)
+            get_queue().submit(self.raw_data_filepath.split('/')[-1], em.main, self.raw_data_filepath, self.destination_filepath, sample_cohort, control_cohort,
+                               sample_col, control_col)
         except AttributeError:
             pass
     
@@ -116,18 +141,20 @@ class ElisaNeutralizationAssayPage(QWidget):
             ErrorMessageBox('No Folder Selected')
             return
         
+        # Imported here so the analysis modules are only loaded once there is something to process
+        import ExcelAutomators.neutralization_assay_main as nam
         if not self.cohort_combobox.currentIndex():
             try:
                 sample_cohort = self.sample_cohort(self.starting_sample_num.text(), self.last_sample_num.text(), self.exclude_nums.text().split(','))
                 control_cohort = self.control_cohort(self.starting_control_num.text(),self.last_control_num.text(),self.excluded_controls.text().split(','))
-                nam.neutralization_assay_singlets(self.raw_data_filepath, self.destination_filepath, None, sample_cohort, control_cohort)
+                get_queue().submit(self.raw_data_filepath.split('/')[-1], nam.neutralization_assay_singlets, self.raw_data_filepath, self.destination_filepath, None, sample_cohort, control_cohort)
             except AttributeError:
                 print("Error")
                 pass
         else:
             try:
                 selected_cohort = self.cohort_combobox.currentText().split("->")[0]
-                nam.neutralization_assay_singlets(self.raw_data_filepath, self.destination_filepath, cohort=selected_cohort)
+                get_queue().submit(self.raw_data_filepath.split('/')[-1], nam.neutralization_assay_singlets, self.raw_data_filepath, self.destination_filepath, cohort=selected_cohort)
             except AttributeError:
                 pass
 
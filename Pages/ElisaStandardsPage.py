@@ -1,8 +1,10 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QFileDialog, QPushButton, QLineEdit, QRadioButton, QComboBox
-from PyQt5.QtGui import QFont, QPixmap
+from PyQt5.QtGui import QFont
 from Classes.DilutionComboBox import DilutionComboBox
 from Classes.ErrorMessageBox import ErrorMessageBox
-import ExcelAutomators.elisa_standards as es
+from Classes.LogoLabel import LogoLabel
+from Classes.JobStatusWidget import JobStatusWidget
+from Classes.AnalysisQueue import get_queue
 from settings import *
 
 class ElisaStandardsPage(QWidget):
@@ -19,9 +21,7 @@ class ElisaStandardsPage(QWidget):
         self.app_description.setFont(QFont('Helvetica', 12))
         self.vertical_layout.addWidget(self.app_description)
         
-        self.logo_image = QPixmap('./Images/logo2.png')
-        self.logo_label = QLabel(self)
-        self.logo_label.setPixmap(self.logo_image.scaled(600,450))
+        self.logo_label = LogoLabel(self)
         self.vertical_layout.addWidget(self.logo_label)
         
         self.prefix = QLineEdit()
@@ -61,6 +61,9 @@ class ElisaStandardsPage(QWidget):
         self.process = QPushButton("Process ELISA Data")
         self.vertical_layout.addWidget(self.process)
         
+        self.job_status = JobStatusWidget(self)
+        self.vertical_layout.addWidget(self.job_status)
+        
         
         self.switch_pages_button.clicked.connect(lambda:parent.setCurrentIndex(1 if parent.currentIndex() != 1 else 0))
         self.select_file_button.clicked.connect(self.open_file_selector)
@@ -89,13 +92,22 @@ class ElisaStandardsPage(QWidget):
         inconsistent_dilution_widget = self.findChild(QWidget, "InconsistentDilution")
         consistent_dilution_widget = self.findChild(QWidget, "ConsistentDilution")
         replicates = "2" if self.duplicates.isChecked() else "3"
+        # Imported here so matplotlib and openpyxl are only loaded once there is something to process
+        import ExcelAutomators.elisa_standards as es
         
         if inconsistent_dilution_widget.isVisible():
             dilution_list, units = inconsistent_dilution_widget.get_input()
-            es.main(self.raw_data_filepath, self.destination_filepath, samples, dilution_list, units, replicates = replicates, prefix=prefix)
+            standard_args = (dilution_list, units)
         elif consistent_dilution_widget.isVisible():
             starting_conc, units, dilution_factor, dilutions = consistent_dilution_widget.get_input()
-            es.main(self.raw_data_filepath, self.destination_filepath, samples, starting_conc, units, dilution_factor, dilutions, replicates=replicates, prefix=prefix)
+            standard_args = (starting_conc, units, dilution_factor, dilutions)
+        else:
+            return
+        
+        # The analysis and the plot rendering run on the queue's threads, the preview of the plot is opened on the GUI thread once it is done
+        images = []
+        get_queue().submit(self.raw_data_filepath.split('/')[-1], es.main, self.raw_data_filepath, self.destination_filepath, samples, *standard_args,
+                           replicates=replicates, prefix=prefix, show_plot=images.append, on_finished=lambda _: [es.show_preview(image) for image in images])
 ### Imported from elisa_main.py
 
     def sample_cohort(self, first:str, last:str, excluded:list[str])->list[int]:
@@ -1,80 +1,41 @@
 from Classes.ExcelWrapper import ExcelWrapper
-from xml.dom import minidom
+from Classes.CohortDatabase import get_database
+from Classes.RunRecorder import note, stage
+from PrismAutomators.prism_templates import get_template
+from PrismAutomators.prism_writer import Binding
+from settings import *
 from typing import Any
-import sqlite3
 
-cur = sqlite3.connect("Databases/NeutralizationAssayDB.sqlite").cursor()
+cohort_db = get_database()
 
 def main(file:str, dest:str, cohort:str|None, first_half:dict, second_half:dict)->None:
-    pzfx_dom = minidom.parse("Templates/neutralization_assay_singlets_template.pzfx")
     new_dest = '/'.join([dest,file.replace(".txt", ".pzfx").split('/')[-1]])
-    lower_conc, higher_conc, lower_conc_elisa, higher_conc_elisa = pzfx_dom.getElementsByTagName("Table")
-    update_tables_without_elisa(lower_conc, first_half)
-    update_tables_without_elisa(higher_conc, second_half)
-    elisa = find_related_elisa(cohort, first_half)
-    update_tables_with_elisa(lower_conc_elisa, first_half, elisa)
-    update_tables_with_elisa(higher_conc_elisa, second_half, elisa)
-    create_prism_file(new_dest,pzfx_dom)
+    with stage("Finding related ELISA"):
+        elisa = find_related_elisa(cohort, first_half)
+    with stage("Filling template"):
+        bindings = []
+        for table, half in enumerate([first_half, second_half]):
+            bindings.extend(bindings_without_elisa(table, half))
+            bindings.extend(bindings_with_elisa(table+2, half, elisa))
+        get_template(NEUTRALIZATION_TEMPLATE).write(new_dest, bindings)
 
-def update_tables_without_elisa(table:minidom.Element, half:dict)->None:
-    sample_numbers, control_flus_rlus, patient_flus_rlus, pos, neg, ns = table.getElementsByTagName("Subcolumn")
-    update_values(sample_numbers, half["sample_numbers"])
-    update_values(control_flus_rlus, half["mirs_flus_rlus"])
-    update_values(patient_flus_rlus, half["sample_flus_rlus"])
-    update_values(pos, half["pos"])
-    update_values(neg, half["neg"])
-    update_values(ns, half["ns"])
+def bindings_without_elisa(table:int, half:dict)->list[Binding]:
+    '''Binds the flus/rlus of one half of the plate to the sample numbers, MIR, patient and control subcolumns of the table'''
+    keys = ["sample_numbers", "mirs_flus_rlus", "sample_flus_rlus", "pos", "neg", "ns"]
+    return [Binding(table, subcolumn, half[key]) for subcolumn, key in enumerate(keys)]
 
-def update_tables_with_elisa(table:minidom.Element, half:dict, elisa:dict)->None:
-    cohort_nums, cohort_ods, cohorts_ods_again, sample_flus_rlus, mir_flus_rlus = table.getElementsByTagName("Subcolumn")
-    new_cohort_nums = half["sample_numbers"].copy()
-    new_cohort_nums.extend(half["mir_numbers"])
-    ods = elisa["sample_ods"].copy()
-    ods.extend(elisa["mir_ods"])
-    update_values(cohort_nums, new_cohort_nums)
-    update_values(cohort_ods, ods)
-    update_values(cohorts_ods_again, ods)
-    update_values(sample_flus_rlus, half["sample_flus_rlus"])
-    update_values(mir_flus_rlus, half["mirs_flus_rlus"])
-
-def update_values(subcolumn:minidom.Element, new_values:list)->None:
-    '''Iterates throught the subcolumn element, assumes that there are "d" child elements and replaces the node value of
-     those elements with the new values in the list. Both the list and the number of "d" child elements should be the same.'''
-    d_elements = subcolumn.getElementsByTagName('d')
-    print(len(d_elements), len(new_values))
-    filtered = []
-    if len(d_elements) != len(new_values):
-        print("The number of values is not the same in the subcolumn and in the new values list creating a filtered list to use instead")
-        for child in d_elements:
-            found_text_node = False
-            base_node = child
-            current_node = child  
-            while not found_text_node:
-                try:
-                    if current_node.nodeType == current_node.TEXT_NODE:
-                        filtered.append(base_node)
-                        found_text_node = True
-                    else:
-                        current_node = current_node.firstChild
-                except AttributeError:
-                    break
-
-    for child, val in zip(filtered if len(filtered) != 0 else d_elements, new_values):
-        found_text_node = False
-        current_node = child  
-        while not found_text_node:
-            try:
-                if current_node.nodeType == current_node.TEXT_NODE:
-                    current_node.nodeValue = val
-                    found_text_node = True
-                else:
-                    current_node = current_node.firstChild
-            except AttributeError:
-                break
-
-def create_prism_file(filename:str, dom:minidom.Document)->None:
-    with open(filename, 'w') as prism: dom.writexml(prism)
-    return None
+def bindings_with_elisa(table:int, half:dict, elisa:dict)->list[Binding]:
+    '''Binds one half of the plate and the related ELISA ODs to the XY table, the patients take the first rows and the MIR
+    controls the rows after them so each flus/rlus value lines up with its own label and OD'''
+    cohort_nums = half["sample_numbers"] + half["mir_numbers"]
+    ods = elisa["sample_ods"] + elisa["mir_ods"]
+    return [
+        Binding(table, 0, cohort_nums),
+        Binding(table, 1, ods),
+        Binding(table, 2, ods),
+        Binding(table, 3, half["sample_flus_rlus"]),
+        Binding(table, 4, half["mirs_flus_rlus"], offset=len(half["sample_numbers"])),
+    ]
 
 def remove_prefix(mir:str|None)->int|None:
     return int(mir.lstrip("MIR")) if mir is not None else mir
@@ -93,24 +54,25 @@ def find_related_elisa(cohort:str|None, half:dict)->dict[str, float]:
     '''
     
     if cohort:
-        sample_ods = [[sample][0][0] for sample in cur.execute(f"SELECT normalizedod FROM {cohort} WHERE label NOT LIKE 'MIR%' AND NOT excluded ORDER BY rowid").fetchall()]
-        cohort_mir_ods = [[mir][0][0] for mir in cur.execute(f"SELECT normalizedod FROM {cohort} WHERE label LIKE 'MIR%' AND NOT excluded ORDER BY rowid").fetchall()]
-        print(len(sample_ods), len(cohort_mir_ods))
+        sample_ods = cohort_db.normalized_ods(cohort)
+        cohort_mir_ods = cohort_db.normalized_ods(cohort, controls=True)
+        note(sample_ods=len(sample_ods), mir_ods=len(cohort_mir_ods))
     # cohort_sample_nums = [int(num) for num in half["sample_numbers"]]
     # cohort_mir_nums = [remove_prefix(mir) for mir in half["mir_numbers"]]
     
     # first = cohort_sample_nums[0]
     # last = cohort_sample_nums[-1]
 
-    # ewrapper = ExcelWrapper("Databases/Compiled Normalized ELISA OD (patients).xlsx")
-    # sample_numbers = ewrapper.get_column('A', values_only = True)
+    # ewrapper = ExcelWrapper("Databases/Compiled Normalized ELISA OD (patients).xlsx", read_only=True)
+    # compiled = ewrapper.get_columns(['A', 'B', 'C', 'D'])
+    # sample_numbers = compiled['A'].tolist()
     
     # first_index = sample_numbers.index(first)
     # last_index = sample_numbers.index(last)
 
-    # sample_ods = ewrapper.get_column('B', values_only=True)[first_index:last_index+1]
-    # mir_numbers =[remove_prefix(mir) for mir in ewrapper.get_column('C', values_only=True)[first_index:last_index+1]]
-    # mir_ods = ewrapper.get_column('D', values_only=True)[first_index:last_index+1]
+    # sample_ods = compiled['B'][first_index:last_index+1].tolist()
+    # mir_numbers =[remove_prefix(mir) for mir in compiled['C'][first_index:last_index+1]]
+    # mir_ods = compiled['D'][first_index:last_index+1].tolist()
     
     # cohort_mir_ods = [od for mir, od in zip(mir_numbers, mir_ods) if is_present(cohort_mir_nums, mir)]
 
@@ -0,0 +1,40 @@
+from PrismAutomators.prism_writer import Binding, compile_slots, render
+from settings import *
+import threading
+
+# Number of Subcolumn elements expected in each Table of the bundled templates
+TEMPLATE_STRUCTURES = {
+    ELISA_TEMPLATE:[3, 3],
+    NEUTRALIZATION_TEMPLATE:[6, 6, 5, 5],
+}
+
+class PrismTemplate:
+
+    def __init__(self, filepath:str, structure:list[int]|None = None):
+        '''Reads a .pzfx template once, compiles the byte offsets of its "d" values into a slot map and checks that every Table
+        has the expected number of Subcolumns'''
+        with open(filepath, "rb") as template: self.source = template.read()
+        self.filepath = filepath
+        self.slots = compile_slots(self.source)
+        self.__validate(structure)
+
+    def __validate(self, structure:list[int]|None)->None:
+        '''Raises a ValueError if the Tables or their Subcolumns do not match the structure the automators expect'''
+        found = [len(table) for table in self.slots]
+        if structure is not None and found != structure:
+            raise ValueError(f"{self.filepath} has Tables with {found} Subcolumns, expected {structure}")
+        return None
+
+    def write(self, filename:str, bindings:list[Binding])->None:
+        '''Writes a copy of the template with the bound values spliced in, no document is built'''
+        with open(filename, "wb") as prism: render(self.source, self.slots, bindings, prism)
+        return None
+
+_registry:dict[str, PrismTemplate] = {}
+_registry_lock = threading.Lock()
+
+def get_template(filepath:str)->PrismTemplate:
+    '''Returns the PrismTemplate of the file, each template is only parsed and validated once per process'''
+    with _registry_lock:
+        if filepath not in _registry: _registry[filepath] = PrismTemplate(filepath, TEMPLATE_STRUCTURES.get(filepath))
+        return _registry[filepath]
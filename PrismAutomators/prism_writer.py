@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import Any, BinaryIO
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+# Byte span (start, end) of the text of every "d" element, indexed as slots[table][subcolumn][row]
+SlotMap = list[list[list[tuple[int, int]]]]
+
+@dataclass
+class Binding:
+    '''Binds a series of values to the rows of one Subcolumn of one Table, starting at row offset. Rows of the Subcolumn that
+    are not covered by the values are emptied, values past the last row of the template are dropped'''
+    table:int
+    subcolumn:int
+    values:list[Any]
+    offset:int = 0
+
+def compile_slots(source:bytes)->SlotMap:
+    '''Finds the byte span of the value of every "d" element of every Subcolumn in every Table of a .pzfx file. The value
+    of a "d" element is its text, or the text of the element it wraps i.e <d><TextAlign align="Left">108</TextAlign></d>,
+    an empty element has an empty span right before its closing tag'''
+    parser = expat.ParserCreate()
+    slots = []
+    state = {"in_table":False, "in_d":False, "text_start":None, "closed":False}
+
+    def start(name:str, _)->None:
+        if name == "Table":
+            slots.append([])
+            state["in_table"] = True
+        elif state["in_table"] and name == "Subcolumn":
+            slots[-1].append([])
+        elif state["in_table"] and name == "d":
+            state.update(in_d=True, text_start=None, closed=False)
+
+    def text(_)->None:
+        if state["in_d"] and not state["closed"] and state["text_start"] is None: state["text_start"] = parser.CurrentByteIndex
+
+    def end(name:str)->None:
+        if name == "Table":
+            state["in_table"] = False
+        elif state["in_d"] and not state["closed"]:
+            end_index = parser.CurrentByteIndex
+            slots[-1][-1].append((state["text_start"] if state["text_start"] is not None else end_index, end_index))
+            state["closed"] = True
+        if name == "d": state["in_d"] = False
+
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = text
+    parser.EndElementHandler = end
+    parser.Parse(source, True)
+    return slots
+
+def render(source:bytes, slots:SlotMap, bindings:list[Binding], destination:BinaryIO)->None:
+    '''Streams the template to the destination with the bound values spliced into their slots, a missing value (None) leaves
+    its "d" element empty'''
+    replacements = []
+    for binding in bindings:
+        rows = slots[binding.table][binding.subcolumn]
+        for row, span in enumerate(rows):
+            index = row - binding.offset
+            value = binding.values[index] if 0 <= index < len(binding.values) else None
+            if value is None: value = ""
+            replacements.append((span, escape(str(value)).encode()))
+    replacements.sort(key=lambda replacement: replacement[0])
+
+    position = 0
+    for (start, end), value in replacements:
+        destination.write(source[position:start])
+        destination.write(value)
+        position = end
+    destination.write(source[position:])
+    return None
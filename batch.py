@@ -0,0 +1,188 @@
+'''Headless entry point that processes a directory or glob of plate exports on a process pool
+
+    python batch.py "Exports/20231128*.txt" --manifest manifest.json --destination Results
+
+The manifest is a json object that maps export file names (or fnmatch patterns) to the run type and its arguments,
+the first matching entry is used for each file:
+    {
+        "elisa_plate1.txt": {"type": "elisa", "samples": "1-32", "controls": "MIR001-MIR013"},
+        "standards_*.txt": {"type": "standards", "samples": "1-20", "standards": ["1", "ug/mL", "2", "6"], "replicates": "2", "prefix": "", "model": "4PL"},
+        "*IFN*.txt": {"type": "neutralization", "cohort": "cohort5"}
+    }
+Samples and controls are lists or comma separated ranges such as "1-30,32" and "MIR001-MIR013,MIR020", the optional "model" of
+a standards run is one of linear, log-linear, 4PL and 5PL (STANDARD_CURVE_MODEL by default) and the optional "cohort" of an
+ELISA is recorded with its saved results, the ODs of the samples the cohort already has are only updated with the ones of
+the plate when the entry also sets "update_cohort": true. The optional "sample_col" and "control_col" of an ELISA are the
+columns its samples and controls start in, see PlateLayout.from_settings. A neutralization entry needs a "cohort", its samples,
+MIR controls and ELISA ODs are read from the cohort. When an entry has no "type" it is detected from the "Plate:" header of
+the export, see detect_run_type. Once every export is processed the controls of the ELISA and neutralization runs of the
+batch are scored against the runs saved before them, see qc.py.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.PlateCache import load_export
+from settings import *
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import sys
+import time
+
+RUN_TYPES = ("elisa", "standards", "neutralization")
+
+@dataclass
+class Job:
+    filepath:str
+    destination:str
+    run_type:str
+    options:dict
+    export:SoftMaxExport|None = None
+
+@dataclass
+class JobResult:
+    filepath:str
+    run_type:str
+    output:str|None
+    seconds:float
+    error:str|None = None
+
+def expand_labels(spec:str|list)->list[int|str]:
+    '''Expands a comma separated list of labels and ranges, i.e "1-3,5" -> [1, 2, 3, 5] and "MIR001-MIR003" -> ["MIR001", "MIR002", "MIR003"],
+    labels that are only digits are returned as integers like the GUI does'''
+    if isinstance(spec, list): return spec
+    labels = []
+    for item in [item.strip() for item in spec.split(",") if item.strip()]:
+        if RANGE_SEP in item:
+            first, last = [end.strip() for end in item.split(RANGE_SEP)]
+            prefix = first.rstrip("0123456789")
+            digits = len(first) - len(prefix)
+            for num in range(int(first[len(prefix):]), int(last[len(prefix):])+1):
+                labels.append(f"{prefix}{num:0{digits}d}" if prefix else num)
+        else:
+            labels.append(int(item) if item.isdigit() else item)
+    return labels
+
+def detect_run_type(export:SoftMaxExport)->str:
+    '''Detects the run type from the plate blocks of an export, luminescence/fluorescence reads or exports with the extra
+    neutralization block are neutralization assays, absorbance reads are ELISAs (standards runs need an explicit type)'''
+    if len(export.blocks) > NEUTRALIZATION_BLOCK or export.header().read_mode in ("Luminescence", "Fluorescence"): return "neutralization"
+    return "elisa"
+
+def match_entry(name:str, manifest:dict[str, dict])->dict|None:
+    '''Returns the first manifest entry whose pattern matches the file name'''
+    return next((options for pattern, options in manifest.items() if fnmatch.fnmatch(name, pattern)), None)
+
+def make_job(filepath:str, entry:dict, destination:str, export:SoftMaxExport|None = None)->Job:
+    '''Creates the Job for an export, the run type is detected from the export when the entry does not name one. Raises a
+    ValueError for a neutralization entry without a cohort, the Prism file needs the ELISA ODs of the cohort'''
+    run_type = entry.get("type")
+    if run_type is None:
+        export = export if export else load_export(filepath)
+        run_type = detect_run_type(export)
+    if run_type not in RUN_TYPES: raise ValueError(f"{os.path.basename(filepath)} has run type {run_type!r}, expected one of {', '.join(RUN_TYPES)}")
+    if run_type == "neutralization" and not entry.get("cohort"):
+        raise ValueError(f"{os.path.basename(filepath)} is a neutralization run without a \"cohort\", its samples and ELISA ODs are read from the cohort")
+    return Job(filepath, destination, run_type, {key:val for key, val in entry.items() if key != "type"}, export)
+
+def find_exports(sources:list[str])->list[str]:
+    '''Returns the sorted absolute paths of the text exports in the directories or matching the globs, the paths use "/" like the
+    file dialogs do since the pipelines split the file name off on "/"'''
+    found = set()
+    for source in sources:
+        matches = glob.glob(os.path.join(source, f"*{TEXT_EXT}")) if os.path.isdir(source) else glob.glob(source)
+        found.update(os.path.abspath(match).replace(os.sep, "/") for match in matches if match.endswith(TEXT_EXT))
+    return sorted(found)
+
+def build_jobs(exports:list[str], manifest:dict[str, dict], destination:str)->list[Job]:
+    '''Pairs every export with the first manifest entry matching its file name, raises a ValueError for unmatched files,
+    unknown run types or two exports that would write to the same output file'''
+    jobs = []
+    outputs = {}
+    for filepath in exports:
+        name = os.path.basename(filepath)
+        entry = match_entry(name, manifest)
+        if entry is None: raise ValueError(f"{name} is not in the manifest")
+        if name in outputs: raise ValueError(f"{filepath} and {outputs[name]} would write to the same output file")
+        outputs[name] = filepath
+        jobs.append(make_job(filepath, entry, destination))
+    return jobs
+
+def run_job(job:Job)->JobResult:
+    '''Runs one export through its pipeline, the pipelines are imported here so they are only loaded in the workers'''
+    start = time.perf_counter()
+    try:
+        if job.run_type == "elisa":
+            import ExcelAutomators.elisa_main as em
+            output = em.main(job.filepath, job.destination, expand_labels(job.options["samples"]), expand_labels(job.options["controls"]), export=job.export, open_excel=False,
+                             cohort=job.options.get("cohort"), update_cohort=bool(job.options.get("update_cohort", False)),
+                             sample_col=job.options.get("sample_col"), control_col=job.options.get("control_col"))
+        elif job.run_type == "standards":
+            import ExcelAutomators.elisa_standards as es
+            output = es.main(job.filepath, job.destination, expand_labels(job.options["samples"]), *job.options["standards"],
+                             replicates=str(job.options.get("replicates", "2")), prefix=job.options.get("prefix") or None, export=job.export,
+                             model=job.options.get("model", STANDARD_CURVE_MODEL), show_plot=False)
+        else:
+            import ExcelAutomators.neutralization_assay_main as nam
+            output = nam.neutralization_assay_singlets(job.filepath, job.destination, job.options["cohort"], export=job.export, open_excel=False)
+    except Exception as error:
+        return JobResult(job.filepath, job.run_type, None, time.perf_counter()-start, f"{type(error).__name__}: {error}")
+    return JobResult(job.filepath, job.run_type, output, time.perf_counter()-start)
+
+def format_result(result:JobResult)->str:
+    '''Formats the summary line of one export'''
+    status = "ok" if result.error is None else "FAILED"
+    detail = result.output if result.error is None else result.error
+    return f"{status:<7}{result.run_type:<16}{result.seconds:>8.2f}s  {os.path.basename(result.filepath)} -> {detail}"
+
+def print_summary(results:list[JobResult], elapsed:float)->None:
+    '''Prints one line per export in input order followed by the totals'''
+    for result in results: print(format_result(result))
+    failed = len([result for result in results if result.error is not None])
+    print(f"{len(results)} exports, {failed} failed, {elapsed:.2f}s")
+
+def print_qc(results:list[JobResult], since:str)->None:
+    '''Prints the control QC of the runs saved since the batch started for every pipeline that saved results'''
+    import qc
+    for pipeline in [pipeline for pipeline in qc.PIPELINES if any(result.run_type == pipeline and result.error is None for result in results)]:
+        lines, rejected = qc.report(pipeline, since)
+        if lines: print("\n".join(lines))
+        if rejected: print(f"{rejected} {pipeline} runs break a Westgard rule")
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Processes a directory or glob of plate reader exports without the GUI")
+    parser.add_argument("exports", nargs="+", help="directories or globs of .txt exports")
+    parser.add_argument("-m", "--manifest", required=True, help="json file mapping export names or patterns to a run type")
+    parser.add_argument("-d", "--destination", required=True, help="directory the Excel and Prism files are written to")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--trace-memory", action="store_true", help="record the peak memory of every stage in the run log, slows the pipelines down")
+    args = parser.parse_args(argv)
+    # The workers inherit the environment, see RunRecorder
+    if args.trace_memory: os.environ["TRACE_MEMORY"] = "1"
+
+    with open(args.manifest, "r") as manifest_file: manifest = json.load(manifest_file)
+    destination = os.path.abspath(args.destination).replace(os.sep, "/")
+    os.makedirs(destination, exist_ok=True)
+    try:
+        jobs = build_jobs(find_exports(args.exports), manifest, destination)
+    except ValueError as error:
+        print(f"nothing processed: {error}", file=sys.stderr)
+        return 1
+    if not jobs:
+        print("No exports found")
+        return 1
+
+    # The templates, layouts and database are opened through paths relative to the repository
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    started = datetime.now().isoformat(sep=" ", timespec="seconds")
+    with ProcessPoolExecutor(max_workers=args.workers) as executor: results = list(executor.map(run_job, jobs))
+    print_summary(results, time.perf_counter()-start)
+    if SAVE_RESULTS: print_qc(results, started)
+    return 0 if all(result.error is None for result in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+'''Rebuilds the cohorts of the database from the legacy sources in Dep/
+
+    python import_cohorts.py "Dep/96 Well PCR Aliquot Database.csv"
+    python import_cohorts.py "Dep/96 Well PCR Aliquot Database.xlsx" --replace
+    python import_cohorts.py Dep/sqlCommand.sql --database Databases/NeutralizationAssayDB.sqlite
+    python import_cohorts.py "Dep/96 Well PCR Aliquot Database.csv" --check "Dep/Compiled Normalized ELISA OD (patients).xlsx"
+
+The aliquot database (.csv or .xlsx) is split into cohorts on its "Cohort # N" banner rows, the cohorts are named cohort1,
+cohort2, ... in the order of their banners like the tables of sqlCommand.sql, and MIR controls are always numbered
+with three digits as in MIR001. The files are read one cohort at a time and
+every row is checked before it is inserted, the sources are loaded in one transaction with the indexes of the samples table
+dropped until the end. A cohort that is already in the database is replaced, so importing the same file again changes
+nothing, with --replace every other cohort is removed as well. The compiled ELISA OD workbook has no cohorts, with --check
+the normalized ODs of its samples are compared against the imported ones.
+'''
+from Classes.CohortDatabase import CohortDatabase, INSERT_SAMPLE, sample_rows
+from settings import *
+from typing import Any, Iterator
+import argparse
+import csv
+import math
+import os
+import re
+import sys
+import time
+
+BANNER = re.compile(r"cohort\s*#\s*(\d+)", re.IGNORECASE)
+HEADER = "MIR Control or Sample Number"
+# MIR controls are numbered with three digits by the GUI, some cohorts of the aliquot database use two
+MIR_LABEL = re.compile(rf"{CONTROL_PREFIX}0*(\d+)", re.IGNORECASE)
+SQL_TABLE = re.compile(r"CREATE TABLE (\w+)", re.IGNORECASE)
+SQL_ROW = re.compile(r"\(\s*'([^']*)'\s*,\s*([^,]*?)\s*,\s*([^,]*?)\s*,\s*(\w+)\s*\)\s*[,;]?$")
+# OD columns of the compiled workbook, (label, OD) for the samples then for the MIR controls
+COMPILED_COLUMNS = ((0, 1), (2, 3))
+# Normalized ODs closer than this are the same, the workbooks keep more digits than the csv and the sql dump
+OD_TOLERANCE = 1e-8
+
+Row = tuple[str, float|None, float|None, bool]
+
+def label_value(value:Any, where:str)->str:
+    '''Sample numbers read from a workbook are numbers, they are stored as the text of the integer, MIR controls as MIR001'''
+    if isinstance(value, float) and value.is_integer(): value = int(value)
+    label = str(value).strip() if value is not None else ""
+    if not label: raise ValueError(f"{where}: missing sample number or MIR control")
+    mir = MIR_LABEL.fullmatch(label)
+    return f"{CONTROL_PREFIX}{int(mir.group(1)):03d}" if mir else label
+
+def od_value(value:Any, where:str)->float|None:
+    if value is None or (isinstance(value, str) and value.strip().upper() in ("", "NULL")): return None
+    try:
+        od = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: {value!r} is not an OD") from None
+    if not math.isfinite(od): raise ValueError(f"{where}: {value!r} is not an OD")
+    return od
+
+def excluded_value(value:Any, where:str)->bool:
+    '''Blank cells are not excluded'''
+    if value is None or isinstance(value, bool): return bool(value)
+    text = str(value).strip().upper()
+    if text in ("", "FALSE", "0"): return False
+    if text in ("TRUE", "1"): return True
+    raise ValueError(f"{where}: {value!r} is not TRUE or FALSE")
+
+def split_cohorts(filepath:str, rows:Iterator[tuple[int, list]])->Iterator[tuple[str, list[Row]]]:
+    '''Groups the (line, cells) of an aliquot database into cohorts on the banner rows, everything before the first banner
+    and the header rows are skipped'''
+    cohort = None
+    cohort_rows:list[Row] = []
+    count = 0
+    for line, cells in rows:
+        cells = [*cells, None, None, None, None][:4]
+        if all(cell is None or str(cell).strip() == "" for cell in cells): continue
+        first = str(cells[0]).strip() if cells[0] is not None else ""
+        banner = BANNER.fullmatch(first)
+        if banner:
+            if cohort is not None: yield cohort, cohort_rows
+            count += 1
+            cohort, cohort_rows = f"cohort{count}", []
+            if int(banner.group(1)) != count: print(f"{filepath}:{line}: banner '{first}' is cohort number {count} of the file, imported as {cohort}", file=sys.stderr)
+            continue
+        if cohort is None or first == HEADER: continue
+        where = f"{filepath}:{line}"
+        cohort_rows.append((label_value(cells[0], where), od_value(cells[1], where), od_value(cells[2], where), excluded_value(cells[3], where)))
+    if cohort is not None: yield cohort, cohort_rows
+
+def read_csv(filepath:str)->Iterator[tuple[str, list[Row]]]:
+    with open(filepath, "r", encoding="utf-8-sig", newline="") as csv_file:
+        yield from split_cohorts(filepath, enumerate(csv.reader(csv_file), start=1))
+
+def read_xlsx(filepath:str)->Iterator[tuple[str, list[Row]]]:
+    '''The workbook is opened read-only so its rows are streamed from the file instead of loaded at once'''
+    import openpyxl
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        yield from split_cohorts(filepath, enumerate(workbook.worksheets[0].iter_rows(max_col=4, values_only=True), start=1))
+    finally:
+        workbook.close()
+
+def read_sql(filepath:str)->Iterator[tuple[str, list[Row]]]:
+    '''Reads the CREATE TABLE and VALUES rows of the sql dump line by line, every table is a cohort'''
+    cohort = None
+    cohort_rows:list[Row] = []
+    with open(filepath, "r", encoding="utf-8-sig") as sql_file:
+        for line, text in enumerate(sql_file, start=1):
+            text = text.strip()
+            table = SQL_TABLE.match(text)
+            if table:
+                if cohort is not None: yield cohort, cohort_rows
+                cohort, cohort_rows = table.group(1), []
+                continue
+            row = SQL_ROW.match(text)
+            if row is None: continue
+            if cohort is None: raise ValueError(f"{filepath}:{line}: values before the first CREATE TABLE")
+            where = f"{filepath}:{line}"
+            cohort_rows.append((label_value(row.group(1), where), od_value(row.group(2), where), od_value(row.group(3), where), excluded_value(row.group(4), where)))
+    if cohort is not None: yield cohort, cohort_rows
+
+READERS = {".csv":read_csv, ".xlsx":read_xlsx, ".sql":read_sql}
+
+def read_source(filepath:str)->Iterator[tuple[str, list[Row]]]:
+    '''Returns the (cohort, rows) of the source one cohort at a time'''
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in READERS: raise ValueError(f"{filepath}: only {', '.join(READERS)} files can be imported")
+    if not os.path.exists(filepath): raise FileNotFoundError(f"{filepath} does not exist")
+    return READERS[extension](filepath)
+
+def import_sources(filepath:str, sources:list[str], replace:bool = False)->dict[str, int]:
+    '''Loads every cohort of the sources into the samples table in one transaction and returns the number of rows per cohort,
+    a cohort found in more than one source is taken from the last one. The indexes of the samples table are dropped while
+    the rows go in and built once at the end, nothing is written if any row of any source is invalid'''
+    database = CohortDatabase(os.path.abspath(filepath))
+    database.create_schema()
+    imported = {}
+    with database.pool.transaction() as connection:
+        indexes = connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'samples' AND sql IS NOT NULL").fetchall()
+        for name, _ in indexes: connection.execute(f"DROP INDEX {name}")
+        if replace: connection.execute("DELETE FROM samples")
+        for source in sources:
+            for cohort, rows in read_source(source):
+                connection.execute("DELETE FROM samples WHERE cohort = ?", (cohort,))
+                connection.executemany(INSERT_SAMPLE, sample_rows(cohort, rows))
+                imported[cohort] = len(rows)
+        for _, sql in indexes: connection.execute(sql)
+    database.close()
+    return imported
+
+def compiled_ods(filepath:str)->Iterator[tuple[str, float]]:
+    '''Returns the (label, normalized OD) of the samples and MIR controls in the compiled ELISA OD workbook'''
+    import openpyxl
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for line, cells in enumerate(workbook.worksheets[0].iter_rows(min_row=2, max_col=4, values_only=True), start=2):
+            for label, od in COMPILED_COLUMNS:
+                if cells[label] is None: continue
+                where = f"{filepath}:{line}"
+                yield label_value(cells[label], where), od_value(cells[od], where)
+    finally:
+        workbook.close()
+
+def check(filepath:str, compiled:str)->list[str]:
+    '''Returns the samples of the compiled workbook whose normalized OD is not the one of any cohort in the database, MIR
+    controls are in every cohort so they only need to match one of them'''
+    database = CohortDatabase(os.path.abspath(filepath))
+    ods:dict[str, list[float|None]] = {}
+    for label, od in database.pool.execute("SELECT label, normalizedod FROM samples"): ods.setdefault(label, []).append(od)
+    database.close()
+    mismatched = []
+    for label, od in compiled_ods(compiled):
+        if not any(od is not None and other is not None and abs(od - other) <= OD_TOLERANCE for other in ods.get(label, [])): mismatched.append(label)
+    return mismatched
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Imports the cohorts of the legacy aliquot database and sql dump into the samples table")
+    parser.add_argument("sources", nargs="+", help="aliquot database .csv/.xlsx files or .sql dumps, later sources win")
+    parser.add_argument("--database", default=DATABASE, help=f"sqlite database to import into, defaults to {DATABASE}")
+    parser.add_argument("--replace", action="store_true", help="remove the cohorts that are not in the sources")
+    parser.add_argument("--check", help="compiled ELISA OD workbook to compare the imported normalized ODs against")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        imported = import_sources(args.database, args.sources, args.replace)
+    except (OSError, ValueError) as error:
+        print(f"nothing imported: {error}", file=sys.stderr)
+        return 1
+    for cohort, count in imported.items(): print(f"{cohort:<12}{count:>6} rows")
+    print(f"{len(imported)} cohorts, {sum(imported.values())} rows imported in {time.perf_counter() - start:.2f}s")
+    if args.check:
+        mismatched = check(args.database, args.check)
+        print(f"{len(mismatched)} labels of {args.check} do not match the database{': ' + ', '.join(mismatched) if mismatched else ''}")
+        if mismatched: return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
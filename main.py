@@ -1,7 +1,6 @@
 from PyQt5.QtWidgets import QStackedWidget, QApplication
 from PyQt5.QtGui import QPalette, QColor
 from PyQt5.QtCore import Qt
-from Pages.ElisaNeutralizationAssayPage import ElisaNeutralizationAssayPage
 from Pages.ElisaStandardsPage import ElisaStandardsPage
 import sys
 
@@ -12,11 +11,18 @@ class StackedPage(QStackedWidget):
         self.setMinimumSize(400,600)
         self.setWindowTitle('ELISA and Neutralization Assay Automator')
         self.first = ElisaStandardsPage(self)
-        self.second = ElisaNeutralizationAssayPage(self)
+        self.second = None
         self.addWidget(self.first)
-        self.addWidget(self.second)
         self.show()
 
+    def setCurrentIndex(self, index:int)->None:
+        '''The neutralization assay page is only built the first time it is switched to'''
+        if index == 1 and self.second is None:
+            from Pages.ElisaNeutralizationAssayPage import ElisaNeutralizationAssayPage
+            self.second = ElisaNeutralizationAssayPage(self)
+            self.addWidget(self.second)
+        super().setCurrentIndex(index)
+
     
 
 def dark_theme(app:QApplication)->QApplication:
@@ -0,0 +1,53 @@
+'''One-shot migration of the cohort database from one table per cohort (cohort1, cohort2, ...) to the single samples table
+
+    python migrate_db.py [Databases/NeutralizationAssayDB.sqlite] [--keep-tables]
+
+The rows of every cohort table are copied in rowid order, which becomes their position, labels starting with the
+CONTROL_PREFIX are flagged as controls. The copy and the removal of the old tables happen in one transaction.
+'''
+from Classes.CohortDatabase import CohortDatabase, INSERT_SAMPLE, sample_rows
+from settings import *
+import argparse
+import os
+import re
+import sys
+
+LEGACY_TABLE = re.compile(r"cohort(\d+)")
+
+def legacy_tables(database:CohortDatabase)->list[str]:
+    '''Returns the names of the per cohort tables ordered by cohort number'''
+    names = [row[0] for row in database.pool.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return sorted([name for name in names if LEGACY_TABLE.fullmatch(name)], key=lambda name: int(LEGACY_TABLE.fullmatch(name).group(1)))
+
+def migrate(filepath:str, keep_tables:bool = False)->dict[str, int]:
+    '''Copies every cohort table into the samples table and returns the number of rows copied per cohort, cohorts that
+    are already in the samples table are skipped so running the migration twice is harmless'''
+    if not os.path.exists(filepath): raise FileNotFoundError(f"{filepath} does not exist")
+    database = CohortDatabase(os.path.abspath(filepath))
+    database.create_schema()
+    migrated = {}
+    existing = set(database.cohorts())
+    with database.pool.transaction() as connection:
+        for table in legacy_tables(database):
+            if table not in existing:
+                rows = connection.execute(f"SELECT label, normalizedod, rawod, excluded FROM {table} ORDER BY rowid").fetchall()
+                connection.executemany(INSERT_SAMPLE, sample_rows(table, rows))
+                migrated[table] = len(rows)
+            if not keep_tables: connection.execute(f"DROP TABLE {table}")
+    database.pool.connection(read_only=False).execute("VACUUM")
+    database.close()
+    return migrated
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Moves the per cohort tables of the database into the single samples table")
+    parser.add_argument("database", nargs="?", default=DATABASE, help=f"sqlite database to migrate, defaults to {DATABASE}")
+    parser.add_argument("--keep-tables", action="store_true", help="keep the old cohort tables after copying them")
+    args = parser.parse_args(argv)
+
+    migrated = migrate(args.database, args.keep_tables)
+    for table, count in migrated.items(): print(f"{table:<12}{count:>6} rows")
+    print(f"{len(migrated)} cohorts migrated")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+'''Levey-Jennings and Westgard QC of the MIR controls of the saved runs
+
+    python qc.py elisa
+    python qc.py neutralization --day 2026-10-18 --window 30
+    python qc.py elisa --all
+
+Every saved run of the pipeline is scored against the window runs saved before it, see Classes/ControlQC.py, ELISAs by the raw
+OD of their MIR controls and neutralization assays by their FLU/RLU with each stimulation scored on its own. Only the runs
+saved on the day are listed unless --all is given, the exit code is 1 if any listed run breaks a rejecting Westgard rule.
+'''
+from Classes.ControlQC import run_history
+from datetime import date, timedelta
+from settings import *
+import argparse
+import math
+import os
+import sys
+
+PIPELINES = ("elisa", "neutralization")
+
+def report(pipeline:str, since:str|None = None, until:str|None = None, window:int = QC_WINDOW)->tuple[list[str], int]:
+    '''Returns the report lines of the runs saved between since and until (local "YYYY-MM-DD HH:MM:SS" times, until is
+    exclusive) and the number of rejected runs'''
+    number = lambda value: "-" if math.isnan(value) else f"{value:.4g}"
+    lines = []
+    rejected = 0
+    for condition, (runs, qc) in run_history(pipeline, window).items():
+        selected = [index for index, run in enumerate(runs) if (since is None or run.saved >= since) and (until is None or run.saved < until)]
+        if not selected: continue
+        lines.append(f"{pipeline}{' ' + condition if condition else ''}, {len(selected)} of {len(runs)} runs, window of {window}")
+        lines.append(f"    {'saved':<21}{'cutoff':>10}{'rolling':>10}{'mean':>10}{'z':>8}  {'status':<8}export")
+        for index in selected:
+            status = "REJECT" if qc.rejected[index] else "warning" if qc.warned[index] else "ok"
+            rules = ",".join(qc.rules(index))
+            lines.append(f"    {runs[index].saved:<21}{number(qc.cutoffs[index]):>10}{number(qc.rolling_cutoffs[index]):>10}{number(qc.means[index]):>10}"
+                         f"{number(qc.z[index]):>8}  {status:<8}{os.path.basename(runs[index].source)}{'  ' + rules if rules else ''}")
+            rejected += int(qc.rejected[index])
+    return lines, rejected
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Scores the controls of the saved runs against the runs before them")
+    parser.add_argument("pipeline", choices=PIPELINES, help="pipeline whose runs are scored")
+    parser.add_argument("--day", default=date.today().isoformat(), help="list the runs saved on this day, YYYY-MM-DD, today by default")
+    parser.add_argument("--all", action="store_true", help="list every saved run")
+    parser.add_argument("-w", "--window", type=int, default=QC_WINDOW, help=f"number of earlier runs each run is scored against, defaults to {QC_WINDOW}")
+    args = parser.parse_args(argv)
+
+    since = until = None
+    if not args.all:
+        since = date.fromisoformat(args.day).isoformat()
+        until = (date.fromisoformat(args.day) + timedelta(days=1)).isoformat()
+    lines, rejected = report(args.pipeline, since, until, args.window)
+    print("\n".join(lines) if lines else f"No {args.pipeline} runs saved{'' if args.all else ' on ' + args.day}")
+    return 1 if rejected else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
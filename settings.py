@@ -12,4 +12,28 @@ EXCEL_EXT = '.xlsx'
 PRISM_EXT = '.pzfx'
 DEFAULT_SAMPLE_COLUMN = 1
 DEFAULT_CONTROL_COLUMN = 9
-DEFAULT_LAST_COLUMN = 12
\ No newline at end of file
+DEFAULT_LAST_COLUMN = 12
+PLATE_HEADER = 'Plate:'
+PLATE_TERMINATOR = '~End'
+PLATE_FORMATS = {96:(8,12), 384:(16,24), 1536:(32,48)}
+
+NEUTRALIZATION_BLOCK = 1
+NEUTRALIZATION_LAYOUT = 'Layouts/neutralization_assay_singlets.json'
+ELISA_TEMPLATE = 'Templates/elisa_template.pzfx'
+NEUTRALIZATION_TEMPLATE = 'Templates/neutralization_assay_singlets_template.pzfx'
+COLUMN_CACHE_DIR = 'Databases/.column_cache'
+PLATE_CACHE_DIR = 'Databases/.plate_cache'
+PLATE_CACHE_BYTES = 256*1024*1024
+PLATE_ARCHIVE_DIR = 'Databases/PlateArchive'
+DATABASE = 'Databases/NeutralizationAssayDB.sqlite'
+LOGO_IMAGE = './Images/logo2.png'
+LOGO_SIZE = (600,450)
+ANALYSIS_THREADS = 2
+PLOT_FORMATS = ['png','svg']
+STANDARD_CURVE_MODEL = 'log-linear'
+RUN_LOG = 'Logs/runs.jsonl'
+PROFILE_DIR = 'Logs/profiles'
+PROFILE_STAGE = None
+TRACE_MEMORY = False
+SAVE_RESULTS = True
+QC_WINDOW = 20
\ No newline at end of file
@@ -0,0 +1,197 @@
+'''Long running mode that watches the plate reader's export folder and processes every export as soon as it is fully written
+
+    python watch.py Exports --manifest manifest.json --destination Results
+
+The manifest has the same format as the one used by batch.py. Exports are picked up through inotify on Linux and by polling
+the folder everywhere else. The exports that were processed, or failed, are recorded in a state file in the destination so
+that a restart only processes new or changed exports, a failed export is only tried again once it is written again.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from Classes.SoftMaxExport import SoftMaxExport
+from Classes.PlateCache import load_export
+from settings import *
+import batch
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+STATE_FILE = '.processed.json'
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class ProcessedStore:
+
+    def __init__(self, filepath:str):
+        '''Keeps the size and modification time of every processed or failed export in a json file'''
+        self.filepath = filepath
+        self.processed = {}
+        if os.path.exists(filepath):
+            with open(filepath, "r") as state_file: self.processed = json.load(state_file)
+
+    def is_current(self, filepath:str, stat:os.stat_result)->bool:
+        '''Returns True if the export was already processed, or failed, and has not changed since'''
+        return self.processed.get(filepath, {}).get("signature") == [stat.st_size, stat.st_mtime_ns]
+
+    def mark(self, filepath:str, stat:os.stat_result, output:str|None, error:str|None = None)->None:
+        '''Records the export as processed or failed, the file is replaced atomically so a crash never leaves half a state file'''
+        self.processed[filepath] = {"signature":[stat.st_size, stat.st_mtime_ns], "output":output, "error":error}
+        with open(f"{self.filepath}.tmp", "w") as state_file: json.dump(self.processed, state_file, indent=1)
+        os.replace(f"{self.filepath}.tmp", self.filepath)
+        return None
+
+class InotifyWatcher:
+
+    def __init__(self, folder:str):
+        '''Watches the folder for written, closed or moved in files through the Linux inotify API'''
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0 or libc.inotify_add_watch(self.fd, folder.encode(), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            raise OSError(ctypes.get_errno(), "inotify is not available")
+        self.folder = folder
+
+    def wait(self, timeout:float)->set[str]:
+        '''Blocks until there are events or the timeout runs out and returns the paths of the files that changed'''
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]: return changed
+        data = os.read(self.fd, 64*1024)
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset+INOTIFY_EVENT.size:offset+INOTIFY_EVENT.size+length].rstrip(b"\0").decode()
+            if name.endswith(TEXT_EXT): changed.add(f"{self.folder}/{name}")
+            offset += INOTIFY_EVENT.size + length
+        return changed
+
+def scan(folder:str)->set[str]:
+    '''Returns the paths of every export in the folder'''
+    with os.scandir(folder) as entries: return {f"{folder}/{entry.name}" for entry in entries if entry.name.endswith(TEXT_EXT) and entry.is_file()}
+
+def read_export(filepath:str)->SoftMaxExport|None:
+    '''Returns the parsed export, or None while the plate reader is still writing it and the last block has no "~End", an export
+    that can not be analyzed i.e with a well that is not a number raises a ValueError'''
+    try:
+        export = load_export(filepath)
+    except UnicodeError:
+        return None
+    return export if export.complete else None
+
+def watch(folder:str, manifest:dict[str, dict], destination:str, settle:float = 2.0, poll:float = 5.0, workers:int|None = None)->None:
+    '''Processes every new or changed export in the folder once its size and modification time have not changed for settle seconds,
+    the worker processes are started again if one of them dies'''
+    store = ProcessedStore(f"{destination}/{STATE_FILE}")
+    try:
+        watcher = InotifyWatcher(folder)
+        print(f"Watching {folder} with inotify")
+    except (OSError, AttributeError, TypeError):
+        watcher = None
+        print(f"Watching {folder} by polling every {poll}s")
+
+    pending = {}
+    running = {}
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        candidates = scan(folder)
+        while True:
+            broken = False
+            for future in [future for future in running if future.done()]:
+                filepath, stat, job = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # Every job still running in the pool fails with it, the export that killed the worker can not be told apart
+                    result = batch.JobResult(filepath, job.run_type, None, 0.0, "the worker process died")
+                    broken = True
+                print(batch.format_result(result), flush=True)
+                store.mark(filepath, stat, result.output, result.error)
+            if broken:
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(max_workers=workers)
+
+            now = time.monotonic()
+            busy = {filepath for filepath, _, _ in running.values()}
+            for filepath in candidates:
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    pending.pop(filepath, None)
+                    continue
+                if filepath in busy or store.is_current(filepath, stat): continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if pending.get(filepath, (None,))[0] != signature: pending[filepath] = (signature, now)
+
+            for filepath, (signature, since) in list(pending.items()):
+                if now - since < settle: continue
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    del pending[filepath]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != signature: continue
+                try:
+                    export = read_export(filepath)
+                except ValueError as error:
+                    del pending[filepath]
+                    print(f"FAILED {os.path.basename(filepath)}: {error}", flush=True)
+                    store.mark(filepath, stat, None, str(error))
+                    continue
+                if export is None: continue
+                del pending[filepath]
+                entry = batch.match_entry(os.path.basename(filepath), manifest)
+                if entry is None:
+                    print(f"skipped {os.path.basename(filepath)}: not in the manifest", flush=True)
+                    store.mark(filepath, stat, None)
+                    continue
+                try:
+                    job = batch.make_job(filepath, entry, destination, export)
+                except ValueError as error:
+                    print(f"skipped {os.path.basename(filepath)}: {error}", flush=True)
+                    store.mark(filepath, stat, None, str(error))
+                    continue
+                try:
+                    future = executor.submit(batch.run_job, job)
+                except BrokenProcessPool:
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                    future = executor.submit(batch.run_job, job)
+                running[future] = (filepath, stat, job)
+
+            timeout = settle if pending or running else poll
+            candidates = (watcher.wait(timeout) | set(pending)) if watcher else (time.sleep(timeout) or scan(folder))
+    finally:
+        executor.shutdown()
+
+def main(argv:list[str]|None = None)->int:
+    parser = argparse.ArgumentParser(description="Watches the plate reader export folder and processes new exports as they are written")
+    parser.add_argument("folder", help="folder the plate reader exports to")
+    parser.add_argument("-m", "--manifest", required=True, help="json file mapping export names or patterns to a run type, see batch.py")
+    parser.add_argument("-d", "--destination", required=True, help="directory the Excel and Prism files are written to")
+    parser.add_argument("-s", "--settle", type=float, default=2.0, help="seconds an export has to stay unchanged before it is processed")
+    parser.add_argument("-p", "--poll", type=float, default=5.0, help="seconds between scans when inotify is not available")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes, defaults to the number of CPUs")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, "r") as manifest_file: manifest = json.load(manifest_file)
+    folder = os.path.abspath(args.folder).replace(os.sep, "/")
+    destination = os.path.abspath(args.destination).replace(os.sep, "/")
+    os.makedirs(destination, exist_ok=True)
+
+    # The templates, layouts and database are opened through paths relative to the repository
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        watch(folder, manifest, destination, args.settle, args.poll, args.workers)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())